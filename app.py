@@ -11,19 +11,9 @@ from bs4 import BeautifulSoup
 import schedule
 import threading
 
-#########################################
-# 多重編碼讀取 CSV 函式
-#########################################
-def try_read_csv(file_path, **kwargs):
-    encodings = ['cp950', 'big5', 'utf-8', 'latin1']
-    last_exception = None
-    for enc in encodings:
-        try:
-            df = pd.read_csv(file_path, encoding=enc, **kwargs)
-            return df
-        except Exception as e:
-            last_exception = e
-    raise last_exception
+from etf_core import DEFAULT_CSV, QUOTE_SYMBOLS, ClassifiedDividendAnalyzer, DividendCalendar, ETFScreener, to_exchange_code
+from live_quotes import LiveQuoteCache
+from price_history import DEFAULT_PATH as DEFAULT_PRICE_HISTORY, UPDATE_LOCK, PriceHistoryStore, performance_summary, total_return_index
 
 #########################################
 # 全局初始化 Session State
@@ -167,6 +157,123 @@ def plot_investment_growth(years, values):
     )
     return fig
 
+def plot_drip_income(years, incomes):
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=years,
+        y=incomes,
+        name='年度配息',
+        marker_color='#2ecc71',
+        hovertemplate="年齡: %{x}<br>年度配息: NT$%{y:,.0f}<extra></extra>"
+    ))
+    fig.update_layout(
+        title=dict(text='年度配息收入 (配息再投入)', font=dict(size=18, color='#87CEEB'), y=0.95),
+        plot_bgcolor='#3A3A3A',
+        paper_bgcolor='#3A3A3A',
+        font=dict(color='#EEEEEE', size=12),
+        xaxis=dict(title='年齡', gridcolor='#555555', zerolinecolor='#555555', tickfont=dict(size=12)),
+        yaxis=dict(title='配息金額 (NT$)', gridcolor='#555555', zerolinecolor='#555555', tickformat=',d', tickfont=dict(size=12)),
+        height=400,
+        margin=dict(l=50, r=50, t=50, b=50)
+    )
+    return fig
+
+def simulate_drip(shares, prices, payouts, monthly_savings, months, start_month,
+                  price_growth=0.0, dividend_growth=0.0, initial_cash=0.0):
+    # 配息再投入模擬：以 (ETF, 月) 矩陣一次算完所有月份，不逐月迴圈
+    # shares/prices 為各ETF目前持有股數與價格，payouts 為 (ETF數, 12) 的每單位配息表
+    # initial_cash 於起始月依持股市值比例加碼買入
+    shares = np.asarray(shares, dtype=float)
+    prices = np.asarray(prices, dtype=float)
+    t = np.arange(1, months + 1)
+    month_idx = (start_month - 1 + t) % 12
+    price_path = prices[:, None] * ((1 + price_growth / 100) ** (t / 12))[None, :]
+    dividend_path = payouts[:, month_idx] * ((1 + dividend_growth / 100) ** (t / 12))[None, :]
+
+    # 每月定期定額依目前持股市值比例分配
+    market_value = shares * prices
+    if market_value.sum() > 0:
+        weights = market_value / market_value.sum()
+    else:
+        weights = np.full(len(shares), 1 / max(len(shares), 1))
+    shares = shares + initial_cash * weights / prices
+    contributions = monthly_savings * weights[:, None] / price_path
+
+    # s_t = s_{t-1} * (1 + d_t / p_t) + c_t 的封閉解
+    growth = np.cumprod(1 + dividend_path / price_path, axis=1)
+    holdings = growth * (shares[:, None] + np.cumsum(contributions / growth, axis=1))
+    holdings_before = np.hstack([shares[:, None], holdings[:, :-1]])
+    income = holdings_before * dividend_path
+    values = holdings * price_path
+    return holdings, values, income
+
+def show_drip_simulation(current_age, retirement_age, initial_investment, monthly_savings):
+    portfolio = st.session_state.portfolio
+    if not portfolio:
+        st.info("請先在「ETF配息分析器」頁面建立投資組合，再進行配息再投入模擬。")
+        return
+    analyzer = load_analyzer()
+    if analyzer.data is None:
+        st.error("讀取配息資料失敗，請確認CSV檔案是否正確。")
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        price_growth = st.number_input("預期股價年成長率 (%)", min_value=-20.0, max_value=20.0, value=0.0, step=0.5)
+    with col2:
+        dividend_growth = st.number_input("預期配息年成長率 (%)", min_value=-20.0, max_value=20.0, value=0.0, step=0.5)
+
+    codes, shares, prices = [], [], []
+    live_prices = get_live_prices(list(portfolio.keys()))
+    for etf, quantity in portfolio.items():
+        price = live_prices.get(etf) or analyzer.get_etf_price(etf)
+        if price is not None:
+            codes.append(etf)
+            shares.append(quantity)
+            prices.append(price)
+    if not codes:
+        st.warning("投資組合中的ETF皆無價格資料，無法模擬。")
+        return
+
+    st.caption("模擬以目前投資組合持股為起點；初始投資金額與每月投入金額皆依持股市值比例買入，"
+               "配息於收益分配基準日所在月份全數再投入。成長僅依上方的股價與配息成長率計算，不使用預期年化報酬率。")
+
+    years = retirement_age - current_age
+    months = years * 12
+    shares = np.array(shares, dtype=float)
+    prices = np.array(prices, dtype=float)
+    start_value = float(shares @ prices) + initial_investment
+    if months == 0:
+        values = [start_value]
+        annual_income = [0.0]
+    else:
+        _, value_paths, income_paths = simulate_drip(
+            shares, prices, analyzer.get_payout_schedule(codes), monthly_savings,
+            months, datetime.date.today().month, price_growth, dividend_growth, initial_investment
+        )
+        values = [start_value] + value_paths.sum(axis=0)[11::12].tolist()
+        annual_income = [0.0] + income_paths.sum(axis=0).reshape(years, 12).sum(axis=1).tolist()
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown(f"""
+        <div class="metric-container">
+            <div class="metric-label">退休時持股市值</div>
+            <div class="metric-value">NT${values[-1]:,.0f}</div>
+        </div>
+        """, unsafe_allow_html=True)
+    with col2:
+        st.markdown(f"""
+        <div class="metric-container">
+            <div class="metric-label">退休前一年平均每月配息</div>
+            <div class="metric-value">NT${annual_income[-1] / 12:,.0f}</div>
+        </div>
+        """, unsafe_allow_html=True)
+
+    year_labels = list(range(current_age, retirement_age + 1))
+    st.plotly_chart(plot_investment_growth(year_labels, values), use_container_width=True)
+    st.plotly_chart(plot_drip_income(year_labels, annual_income), use_container_width=True)
+
 def show_investment_calculator():
     st.markdown("<h1>存股計算</h1>", unsafe_allow_html=True)
     
@@ -177,13 +284,26 @@ def show_investment_calculator():
         retirement_age = st.number_input("預計退休年齡", min_value=current_age, max_value=100, value=st.session_state.retirement_age, step=1)
         initial_investment = st.number_input("初始投資金額 (NT$)", min_value=0, value=st.session_state.initial_investment, step=10000)
         monthly_savings = st.number_input("每月投入金額 (NT$)", min_value=0, value=st.session_state.monthly_savings, step=1000)
-        expected_return = st.number_input("預期年化報酬率 (%)", min_value=0.0, max_value=20.0, value=st.session_state.expected_return, step=0.5)
+        # 配息再投入模擬改用股價/配息成長率，停用固定報酬率輸入
+        expected_return = st.number_input("預期年化報酬率 (%)", min_value=0.0, max_value=20.0, value=st.session_state.expected_return, step=0.5,
+                                          disabled=st.session_state.get('calc_mode') == "配息再投入模擬")
         
         st.session_state.current_age = current_age
         st.session_state.retirement_age = retirement_age
         st.session_state.initial_investment = initial_investment
         st.session_state.monthly_savings = monthly_savings
         st.session_state.expected_return = expected_return
+
+    calc_mode = st.radio(
+        "計算模式",
+        ["固定報酬率", "配息再投入模擬"],
+        horizontal=True,
+        key="calc_mode"
+    )
+    if calc_mode == "配息再投入模擬":
+        st.markdown("<h3>配息再投入模擬</h3>", unsafe_allow_html=True)
+        show_drip_simulation(current_age, retirement_age, initial_investment, monthly_savings)
+        return
     
     years = retirement_age - current_age
     monthly_return = (1 + expected_return/100) ** (1/12) - 1
@@ -231,124 +351,39 @@ def show_investment_calculator():
     """, unsafe_allow_html=True)
 
 #########################################
-# ETF 配息分析器核心類別與函式
+# ETF 配息分析器載入（核心邏輯位於 etf_core.py）
 #########################################
-class ClassifiedDividendAnalyzer:
-    def __init__(self):
-        self.data_path = os.path.dirname(os.path.abspath(__file__))
-        unified_file = os.path.join(self.data_path, 'etf_dividend_022.csv')
-        try:
-            self.price_data = try_read_csv(unified_file)
-            self.price_data['股票代號'] = self.price_data['股票代號'].astype(str).str.strip()
-            self.price_data['股票代號'] = self.price_data['股票代號'].apply(self.format_etf_code)
-            self.price_data['收盤價'] = pd.to_numeric(self.price_data['收盤價'], errors='coerce')
-            self.price_data = self.price_data.dropna(subset=['收盤價'])
-        except Exception as e:
-            st.error("讀取價格數據時發生錯誤: " + str(e))
-            self.price_data = None
-        try:
-            self.data = try_read_csv(unified_file)
-            self.data['股票代號'] = self.data['股票代號'].astype(str).str.strip()
-            self.data['股票代號'] = self.data['股票代號'].apply(self.format_etf_code)
-            self.data['除息日'] = pd.to_datetime(self.data['除息日'], errors='coerce')
-            self.data = self.data.dropna(subset=['除息日'])
-            self.data['月份'] = self.data['除息日'].dt.month
-            self.classify_dividends()
-        except Exception as e:
-            st.error("讀取配息數據時發生錯誤: " + str(e))
-            self.data = None
+@st.cache_resource(max_entries=1)
+def load_shared_analyzer(modified_time):
+    # 每個程序只保留一份分析器，所有工作階段與 rerun 共用；CSV 更新後依修改時間重建
+    # 共用物件不可修改：analyzer.data / price_data 為唯讀，需要調整時請先 .copy() 再處理
+    return ClassifiedDividendAnalyzer()
 
-    def format_etf_code(self, code):
-        code = str(code).strip()
-        if len(code) < 5 and 'B' not in code:
-            code = code.zfill(5)
-        return code
+def data_modified_time():
+    return os.path.getmtime(DEFAULT_CSV) if os.path.exists(DEFAULT_CSV) else 0
 
-    def classify_dividends(self):
-        if self.data is None:
-            return
-        self.data['發放標籤'] = '不定期'
-        for etf_code in self.data['股票代號'].unique():
-            etf_data = self.data[self.data['股票代號'] == etf_code]
-            dividend_count = len(etf_data)
-            months = sorted(etf_data['月份'].unique())
-            if dividend_count >= 12:
-                self.data.loc[self.data['股票代號'] == etf_code, '發放標籤'] = '月月配'
-            elif dividend_count == 4:
-                if months == [1, 4, 7, 10]:
-                    self.data.loc[self.data['股票代號'] == etf_code, '發放標籤'] = '季配息(1,4,7,10月)'
-                elif months == [2, 5, 8, 11]:
-                    self.data.loc[self.data['股票代號'] == etf_code, '發放標籤'] = '季配息(2,5,8,11月)'
-                elif months == [3, 6, 9, 12]:
-                    self.data.loc[self.data['股票代號'] == etf_code, '發放標籤'] = '季配息(3,6,9,12月)'
-            elif dividend_count == 2:
-                self.data.loc[self.data['股票代號'] == etf_code, '發放標籤'] = '半年配'
-            elif dividend_count == 1:
-                self.data.loc[self.data['股票代號'] == etf_code, '發放標籤'] = '年配'
-        if '每單位配發金額(元)' in self.data.columns:
-            self.data['每千單位配發金額'] = self.data['每單位配發金額(元)'] * 1000
-        else:
-            st.error("CSV 缺少「每單位配發金額(元)」欄位，請確認。")
-
-    def get_etfs_by_dividend_frequency(self):
-        if self.data is None:
-            return {}
-        freq_map = {}
-        for freq in self.data['發放標籤'].unique():
-            freq_map[freq] = sorted(self.data.loc[self.data['發放標籤'] == freq, '股票代號'].unique())
-        return freq_map
-
-    def get_all_etfs(self):
-        if self.data is not None and self.price_data is not None:
-            data_codes = set(self.data['股票代號'].astype(str))
-            price_codes = set(self.price_data['股票代號'].astype(str))
-            valid_etfs = data_codes.intersection(price_codes)
-            return sorted(list(valid_etfs))
-        return []
+def load_analyzer():
+    analyzer = load_shared_analyzer(data_modified_time())
+    for message in analyzer.errors:
+        st.error(message)
+    return analyzer
 
-    def get_etf_name(self, etf_code):
-        etf_code = self.format_etf_code(etf_code)
-        if self.price_data is not None and etf_code in self.price_data['股票代號'].values:
-            return self.price_data[self.price_data['股票代號'] == etf_code]['股票名稱'].iloc[0]
-        elif self.data is not None:
-            mask = self.data['股票代號'] == etf_code
-            if mask.any():
-                return self.data[mask]['股票名稱'].iloc[0]
-        return f"ETF {etf_code}"
-
-    def get_etf_price(self, etf_code):
-        etf_code = self.format_etf_code(etf_code)
-        if self.price_data is not None and etf_code in self.price_data['股票代號'].values:
-            return float(self.price_data[self.price_data['股票代號'] == etf_code]['收盤價'].iloc[0])
-        return None
+#########################################
+# 即時報價（側邊欄開啟時才向上游查詢，所有工作階段共用同一份快取）
+#########################################
+@st.cache_resource
+def load_quote_cache():
+    return LiveQuoteCache()
 
-    def calculate_investment_cost(self, portfolio):
-        total_cost = 0
-        details = []
-        for etf, quantity in portfolio.items():
-            price = self.get_etf_price(etf)
-            if price is not None:
-                cost = price * quantity
-                details.append({
-                    "ETF代號": etf,
-                    "ETF名稱": self.get_etf_name(etf),
-                    "購買數量（千股）": f"{quantity/1000:.1f}",
-                    "實際股數": f"{quantity:,}",
-                    "收盤價": f"{price:.2f}",
-                    "投資金額": f"NT${cost:,.0f}"
-                })
-                total_cost += cost
-        return total_cost, details
-
-    def get_monthly_dividends(self, portfolio):
-        if self.data is None or not portfolio:
-            return None
-        filtered_data = self.data[self.data['股票代號'].isin(portfolio.keys())].copy()
-        for etf, quantity in portfolio.items():
-            mask = filtered_data['股票代號'] == etf
-            if '每千單位配發金額' in filtered_data.columns:
-                filtered_data.loc[mask, '每千單位配發金額'] *= quantity / 1000
-        return filtered_data
+def get_live_prices(etf_codes):
+    # 與投資組合的代號合併為一次批次查詢，同一次 rerun 之後的查詢皆可命中快取
+    if not st.session_state.get('live_prices') or not etf_codes:
+        return {}
+    codes = list(dict.fromkeys(list(etf_codes) + list(st.session_state.portfolio.keys())))
+    return load_quote_cache().get_prices(codes)
+
+def get_display_price(analyzer, etf_code):
+    return get_live_prices([etf_code]).get(etf_code) or analyzer.get_etf_price(etf_code)
 
 #########################################
 # 投資組合管理與指標展示相關函式
@@ -371,10 +406,7 @@ def display_portfolio_metrics(analyzer, portfolio_data, total_cost):
     <div class="metric-value">NT${total_cost:,.0f}</div>
 </div>
 """, unsafe_allow_html=True)
-    annual_dividends = 0
-    filtered_data = analyzer.get_monthly_dividends(st.session_state.portfolio)
-    if filtered_data is not None and not filtered_data.empty:
-        annual_dividends = filtered_data['每千單位配發金額'].sum()
+    annual_dividends = analyzer.portfolio_metrics(st.session_state.portfolio)['annual_dividends']
     with col2:
         st.markdown(f"""
 <div class="metric-container">
@@ -529,6 +561,58 @@ def create_portfolio_summary_chart(portfolio_data):
     )
     return fig
 
+def plot_total_return(dates, index, codes):
+    fig = go.Figure()
+    colors = ['#87CEEB', '#2ecc71', '#e74c3c', '#f1c40f', '#9b59b6',
+              '#1abc9c', '#e67e22', '#34495e', '#16a085', '#c0392b']
+    for idx, etf_code in enumerate(codes):
+        fig.add_trace(go.Scatter(
+            x=dates,
+            y=(index[idx] - 1) * 100,
+            mode='lines',
+            name=etf_code,
+            line=dict(color=colors[idx % len(colors)], width=2),
+            hovertemplate=f"ETF: {etf_code}<br>日期: %{{x|%Y-%m-%d}}<br>含息報酬: %{{y:.2f}}%<extra></extra>"
+        ))
+    fig.update_layout(
+        title=dict(text='含息累積報酬率', font=dict(size=18, color='#87CEEB'), y=0.95),
+        plot_bgcolor='#3A3A3A',
+        paper_bgcolor='#3A3A3A',
+        font=dict(color='#EEEEEE', size=12),
+        xaxis=dict(title='日期', gridcolor='#555555', zerolinecolor='#555555', tickfont=dict(size=12)),
+        yaxis=dict(title='報酬率 (%)', gridcolor='#555555', zerolinecolor='#555555', tickfont=dict(size=12)),
+        height=400,
+        margin=dict(l=50, r=50, t=50, b=50)
+    )
+    return fig
+
+@st.cache_resource(max_entries=1)
+def load_price_history(modified_time):
+    # 以檔案修改時間作為快取鍵，每日更新後自動重新載入
+    return PriceHistoryStore()
+
+def show_price_history(portfolio):
+    store = load_price_history(os.path.getmtime(DEFAULT_PRICE_HISTORY) if os.path.exists(DEFAULT_PRICE_HISTORY) else 0)
+    codes, dates, closes, dividends = store.matrices(list(portfolio.keys()))
+    st.markdown("<h3>歷史績效</h3>", unsafe_allow_html=True)
+    if not codes or len(dates) == 0:
+        st.info("尚無投資組合ETF的歷史價格資料，資料會在每日更新時建立。")
+        return
+    st.plotly_chart(plot_total_return(dates, total_return_index(closes, dividends), codes),
+                    use_container_width=True, config={'displayModeBar': False})
+    first_date = pd.Timestamp(dates[0]).date()
+    last_date = pd.Timestamp(dates[-1]).date()
+    default_buy = max(first_date, last_date - datetime.timedelta(days=365))
+    buy_date = st.date_input("買進日期（計算成本殖利率）", value=default_buy,
+                             min_value=first_date, max_value=last_date, key="buy_date")
+    summary = performance_summary(store, codes, buy_date)
+    st.dataframe(summary.round(2), use_container_width=True, hide_index=True)
+
+@st.cache_resource(max_entries=1)
+def load_etf_screener(modified_time):
+    # 特徵表每份資料只建立一次，CSV 更新後依修改時間重建
+    return ETFScreener(load_shared_analyzer(modified_time))
+
 #########################################
 # ETF 配息分析器頁面
 #########################################
@@ -538,7 +622,7 @@ def show_analyzer():
     <h1>ETF配息分析器</h1>
 </div>
 """, unsafe_allow_html=True)
-    analyzer = ClassifiedDividendAnalyzer()
+    analyzer = load_analyzer()
     if analyzer.data is not None:
         col1, col2 = st.columns(2)
         with col1:
@@ -549,7 +633,7 @@ def show_analyzer():
 """, unsafe_allow_html=True)
             search_method = st.radio(
                 "選擇搜尋方式",
-                ["配息類型篩選", "搜尋ETF"],
+                ["配息類型篩選", "搜尋ETF", "多條件篩選"],
                 horizontal=True,
                 key="search_method"
             )
@@ -564,7 +648,7 @@ def show_analyzer():
                         if filtered_etfs:
                             temp_selected_etf = st.selectbox("選擇ETF", filtered_etfs,
                                                              format_func=lambda x: f"{x} ({analyzer.get_etf_name(x)})")
-                            price = analyzer.get_etf_price(temp_selected_etf)
+                            price = get_display_price(analyzer, temp_selected_etf)
                             if price:
                                 st.markdown(r"""
 <div class="etf-info">
@@ -596,7 +680,7 @@ def show_analyzer():
                             matched_etfs,
                             format_func=lambda x: f"{x} ({analyzer.get_etf_name(x)})"
                         )
-                        price = analyzer.get_etf_price(temp_selected_etf)
+                        price = get_display_price(analyzer, temp_selected_etf)
                         if price:
                             st.markdown(r"""
 <div class="etf-info">
@@ -611,6 +695,48 @@ def show_analyzer():
                                 st.warning("此ETF已在投資組合中")
                     else:
                         st.info("沒有符合關鍵字的ETF。")
+            elif search_method == "多條件篩選":
+                screener = load_etf_screener(data_modified_time())
+                features = screener.features
+                if features.empty:
+                    st.warning("目前無法取得任何ETF資料，請確認CSV檔案是否正確。")
+                else:
+                    max_yield = float(np.ceil(features['殖利率(%)'].max()))
+                    max_price = float(np.ceil(features['收盤價'].max()))
+                    yield_range = st.slider("殖利率 (%)", 0.0, max_yield, (0.0, max_yield), step=0.5, key="screen_yield")
+                    price_range = st.slider("收盤價 (NT$)", 0.0, max_price, (0.0, max_price), step=1.0, key="screen_price")
+                    frequencies = st.multiselect("配息頻率", sorted(features['發放標籤'].unique()), key="screen_frequency")
+                    months = st.multiselect("配息月份", list(range(1, 13)), format_func=lambda m: f"{m}月", key="screen_months")
+                    match_all_months = st.checkbox("需於所有選定月份皆配息", value=True, key="screen_match_all")
+                    min_consistency = st.slider("最低配息穩定度 (%)", 0, 100, 0, step=5, key="screen_consistency",
+                                                help="最低一次配息金額 / 最高一次配息金額")
+                    results = screener.screen(
+                        yield_range=yield_range,
+                        price_range=price_range,
+                        frequencies=frequencies,
+                        months=months,
+                        match_all_months=match_all_months,
+                        min_consistency=min_consistency
+                    )
+                    if not results.empty:
+                        st.dataframe(
+                            results[['股票代號', '股票名稱', '收盤價', '殖利率(%)', '發放標籤', '配息穩定度(%)']].round(2),
+                            use_container_width=True, hide_index=True, height=250
+                        )
+                        temp_selected_etf = st.selectbox(
+                            "選擇ETF",
+                            results['股票代號'].tolist(),
+                            format_func=lambda x: f"{x} ({analyzer.get_etf_name(x)})",
+                            key="screen_select"
+                        )
+                        if st.button("➕ 添加到投資組合", key="btn_add_etf_screener"):
+                            if temp_selected_etf not in st.session_state.selected_etfs:
+                                st.session_state.selected_etfs[temp_selected_etf] = 0
+                                st.success(f"已添加 {temp_selected_etf} 到投資組合")
+                            else:
+                                st.warning("此ETF已在投資組合中")
+                    else:
+                        st.info("沒有符合篩選條件的ETF。")
         with col2:
             st.markdown(r"""
 <div class="portfolio-section">
@@ -645,7 +771,8 @@ def show_analyzer():
     <h2>投資組合分析</h2>
 </div>
 """, unsafe_allow_html=True)
-            total_cost, portfolio_data = analyzer.calculate_investment_cost(st.session_state.portfolio)
+            live_prices = get_live_prices(list(st.session_state.portfolio.keys()))
+            total_cost, portfolio_data = analyzer.calculate_investment_cost(st.session_state.portfolio, live_prices)
             if portfolio_data:
                 display_portfolio_metrics(analyzer, portfolio_data, total_cost)
                 filtered_data = analyzer.get_monthly_dividends(st.session_state.portfolio)
@@ -665,15 +792,93 @@ def show_analyzer():
                 with col2:
                     st.plotly_chart(create_portfolio_summary_chart(pd.DataFrame(portfolio_data)),
                                       use_container_width=True, config={'displayModeBar': False})
+                show_price_history(st.session_state.portfolio)
     else:
         st.error("讀取配息資料失敗，請確認CSV檔案是否正確。")
 
 #########################################
-# 側邊欄：只保留捐款按鈕
+# 除息行事曆頁面
+#########################################
+@st.cache_resource(max_entries=1)
+def load_dividend_calendar(modified_time):
+    return DividendCalendar(load_shared_analyzer(modified_time).data)
+
+def plot_cash_flow_calendar(cash_flows):
+    pivot_data = cash_flows.pivot_table(
+        index='日期',
+        columns='股票代號',
+        values='配息金額',
+        aggfunc='sum',
+        fill_value=0
+    )
+    fig = go.Figure()
+    colors = ['#87CEEB', '#2ecc71', '#e74c3c', '#f1c40f', '#9b59b6',
+              '#1abc9c', '#e67e22', '#34495e', '#16a085', '#c0392b']
+    for idx, etf_code in enumerate(pivot_data.columns):
+        fig.add_trace(go.Bar(
+            x=pivot_data.index,
+            y=pivot_data[etf_code],
+            name=etf_code,
+            marker_color=colors[idx % len(colors)],
+            hovertemplate=f"ETF: {etf_code}<br>日期: %{{x|%Y-%m-%d}}<br>配息: NT$%{{y:,.0f}}<extra></extra>"
+        ))
+    fig.update_layout(
+        title=dict(text=f"投資組合配息入帳 (合計: NT${cash_flows['配息金額'].sum():,.0f})", font=dict(size=18, color='#87CEEB'), y=0.95),
+        barmode='stack',
+        plot_bgcolor='#3A3A3A',
+        paper_bgcolor='#3A3A3A',
+        font=dict(color='#EEEEEE', size=12),
+        xaxis=dict(title='日期', gridcolor='#555555', zerolinecolor='#555555', tickformat='%m/%d', tickfont=dict(size=12)),
+        yaxis=dict(title='配息金額 (NT$)', gridcolor='#555555', zerolinecolor='#555555', tickformat=',d', tickfont=dict(size=12)),
+        height=400,
+        margin=dict(l=50, r=50, t=50, b=50)
+    )
+    return fig
+
+def show_dividend_calendar():
+    st.markdown("<h1>除息行事曆</h1>", unsafe_allow_html=True)
+    st.caption("日期依最近一個年度的除息日與收益分配基準日推估，實際日期以各投信公告為準。")
+    calendar = load_dividend_calendar(data_modified_time())
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        start_date = st.date_input("起始日期", value=datetime.date.today(), key="calendar_start")
+    with col2:
+        days = st.number_input("查詢天數", min_value=1, max_value=366, value=14, step=1, key="calendar_days")
+    with col3:
+        date_column = st.selectbox("日期類型", ["除息日", "收益分配基準日"], key="calendar_column")
+    end_date = start_date + datetime.timedelta(days=int(days) - 1)
+
+    scope = st.radio("查詢範圍", ["全部ETF", "我的投資組合"], horizontal=True, key="calendar_scope")
+    if scope == "全部ETF":
+        events = calendar.events_between(start_date, end_date, column=date_column)
+        if events.empty:
+            st.info("此期間內沒有ETF除息。")
+        else:
+            st.markdown(f"<h3>{start_date} ~ {end_date} 共 {len(events)} 筆</h3>", unsafe_allow_html=True)
+            events['日期'] = events['日期'].dt.strftime('%Y-%m-%d')
+            st.dataframe(events, use_container_width=True, hide_index=True)
+    else:
+        portfolio = st.session_state.portfolio
+        if not portfolio:
+            st.info("請先在「ETF配息分析器」頁面建立投資組合。")
+            return
+        cash_flows = calendar.portfolio_cash_flows(portfolio, start_date, end_date, column=date_column)
+        if cash_flows.empty:
+            st.info("投資組合在此期間內沒有配息。")
+            return
+        st.plotly_chart(plot_cash_flow_calendar(cash_flows), use_container_width=True, config={'displayModeBar': False})
+        cash_flows['日期'] = cash_flows['日期'].dt.strftime('%Y-%m-%d')
+        st.dataframe(cash_flows, use_container_width=True, hide_index=True)
+
+#########################################
+# 側邊欄：即時報價開關與捐款按鈕
 #########################################
 def show_sidebar():
     st.sidebar.markdown("<h2>投資理財工具</h2>", unsafe_allow_html=True)
     st.sidebar.markdown("這是一個幫助您分析ETF配息與存股投資的工具。")
+    st.sidebar.toggle("即時報價", key="live_prices",
+                      help="開啟後價格改用盤中即時報價（約每分鐘更新），無法取得時沿用資料檔收盤價。")
     st.sidebar.markdown("---")
     st.sidebar.markdown("""
     <a href="https://pay.soundon.fm/podcasts/48c567ce-cca7-4442-b327-ba611ad307d2" target="_blank" class="donate-button">
@@ -682,23 +887,28 @@ def show_sidebar():
     """, unsafe_allow_html=True)
 
 #########################################
-# 主程式入口：使用 st.tabs 呈現兩大功能
+# 主程式入口：使用 st.tabs 呈現各功能頁面
 #########################################
 def main():
     show_sidebar()
-    tabs = st.tabs(["存股計算", "ETF配息分析器"])
+    tabs = st.tabs(["存股計算", "ETF配息分析器", "除息行事曆"])
     with tabs[0]:
         show_investment_calculator()
     with tabs[1]:
         show_analyzer()
+    with tabs[2]:
+        show_dividend_calendar()
 
 #########################################
 # 定時任務與 ETF 數據更新功能
 #########################################
+@st.cache_resource
 def start_scheduler():
+    # 每次 rerun 都會執行主程式入口，以快取確保每個程序只啟動一個排程執行緒
     scheduler_thread = threading.Thread(target=schedule_update)
     scheduler_thread.daemon = True
     scheduler_thread.start()
+    return scheduler_thread
 
 def schedule_update():
     schedule.every().day.at("02:00").do(update_etf_data)
@@ -711,6 +921,10 @@ def schedule_update():
         time.sleep(60)
 
 def update_etf_data():
+    # 同一時間只允許一個更新工作，其餘呼叫直接略過
+    if not UPDATE_LOCK.acquire(blocking=False):
+        print("ETF數據更新已在進行中，略過本次更新")
+        return
     try:
         print(f"開始更新ETF數據: {datetime.datetime.now()}")
         etf_list = fetch_etf_list_from_twse()
@@ -729,23 +943,31 @@ def update_etf_data():
             print(f"ETF數據已更新並保存到 {csv_path}")
             with open(os.path.join(data_dir, 'last_update.txt'), 'w') as f:
                 f.write(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            update_price_history(etf_list)
         else:
             print("獲取的ETF數據為空")
     except Exception as e:
         print(f"更新ETF數據時出錯: {str(e)}")
+    finally:
+        UPDATE_LOCK.release()
 
 #########################################
 # 爬蟲功能：從Yahoo Finance獲取ETF數據
 #########################################
+def to_yahoo_code(etf_code):
+    # 已知市場依對照表 (例如 006201 為上櫃)，其餘為證交所列表中的上市ETF
+    code = to_exchange_code(etf_code)
+    if code in QUOTE_SYMBOLS:
+        return QUOTE_SYMBOLS[code]
+    if code.isdigit() or (len(code) >= 4 and code[:4].isdigit()):
+        return f"{code}.TW"
+    return code
+
 def fetch_etf_data_from_yahoo(etf_list):
     result_data = []
     for etf_code in etf_list:
         try:
-            if etf_code.isdigit() or (len(etf_code) >= 4 and etf_code[:4].isdigit()):
-                yahoo_code = f"{etf_code}.TW"
-            else:
-                yahoo_code = etf_code
-            etf = yf.Ticker(yahoo_code)
+            etf = yf.Ticker(to_yahoo_code(etf_code))
             info = etf.info
             hist = etf.history(period="1d")
             if not hist.empty:
@@ -779,6 +1001,29 @@ def fetch_etf_data_from_yahoo(etf_list):
     else:
         return pd.DataFrame()
 
+#########################################
+# 爬蟲功能：增量更新本地歷史價格庫
+#########################################
+def update_price_history(etf_list):
+    store = PriceHistoryStore()
+    for etf_code in etf_list:
+        try:
+            last_date = store.last_date(etf_code)
+            etf = yf.Ticker(to_yahoo_code(etf_code))
+            if last_date is None:
+                hist = etf.history(period="10y", auto_adjust=False)
+            else:
+                hist = etf.history(start=(last_date + datetime.timedelta(days=1)).strftime('%Y-%m-%d'), auto_adjust=False)
+            hist = hist.dropna(subset=['Close'])
+            if hist.empty:
+                continue
+            dividends = hist['Dividends'] if 'Dividends' in hist.columns else None
+            store.append(etf_code, hist.index, hist['Close'], dividends)
+        except Exception as e:
+            print(f"更新 {etf_code} 歷史價格時出錯: {str(e)}")
+    store.save()
+    print(f"歷史價格已更新並保存到 {store.path}")
+
 #########################################
 # 爬蟲功能：從台灣證券交易所獲取ETF列表
 #########################################
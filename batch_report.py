@@ -0,0 +1,114 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from etf_core import ClassifiedDividendAnalyzer, format_etf_code, try_read_csv
+
+#########################################
+# 批次投資組合報表：不需 Streamlit，一次計算大量客戶的投資組合指標
+# 持股檔欄位：client, code, shares（實際股數）
+#########################################
+MONTH_COLUMNS = [f'{m}月' for m in range(1, 13)]
+PARALLEL_THRESHOLD = 2_000_000
+
+def build_etf_table(analyzer):
+    # 每個ETF一列：[收盤價, 1月配息, ..., 12月配息]（皆為每單位金額）
+    codes, prices, payouts = analyzer.get_payout_table()
+    return codes, np.column_stack([prices, payouts])
+
+def aggregate_holdings(client_idx, etf_idx, shares, etf_table, n_clients):
+    # 以 COO 稀疏矩陣 (客戶 x ETF) 乘上 ETF 表：每一欄做一次加權 bincount
+    return np.column_stack([
+        np.bincount(client_idx, weights=shares * etf_table[etf_idx, col], minlength=n_clients)
+        for col in range(etf_table.shape[1])
+    ])
+
+def _aggregate_chunk(args):
+    client_idx, etf_idx, shares, etf_table, offset, n_clients = args
+    return offset, aggregate_holdings(client_idx - offset, etf_idx, shares, etf_table, n_clients)
+
+def compute_reports(holdings, analyzer, workers=1):
+    codes, etf_table = build_etf_table(analyzer)
+    holdings = holdings.dropna(subset=['client', 'code'])
+    client_idx, clients = pd.factorize(holdings['client'], sort=True)
+    # 代號只有數百種：先 factorize，只格式化不重複的代號再對應回每一列
+    code_idx, raw_codes = pd.factorize(holdings['code'])
+    etf_idx = codes.get_indexer([format_etf_code(code) for code in raw_codes.astype(str)])[code_idx]
+    shares = pd.to_numeric(holdings['shares'], errors='coerce').fillna(0).to_numpy(dtype=float)
+
+    known = etf_idx >= 0
+    unknown_counts = np.bincount(client_idx[~known], minlength=len(clients))
+    client_idx, etf_idx, shares = client_idx[known], etf_idx[known], shares[known]
+
+    if workers > 1 and len(client_idx) >= PARALLEL_THRESHOLD:
+        # 依客戶排序後切塊，確保同一客戶只落在一個工作程序
+        order = np.argsort(client_idx, kind='stable')
+        client_idx, etf_idx, shares = client_idx[order], etf_idx[order], shares[order]
+        bounds = np.linspace(0, len(clients), workers + 1).astype(int)
+        starts = np.searchsorted(client_idx, bounds)
+        tasks = [
+            (client_idx[starts[i]:starts[i + 1]], etf_idx[starts[i]:starts[i + 1]],
+             shares[starts[i]:starts[i + 1]], etf_table, bounds[i], bounds[i + 1] - bounds[i])
+            for i in range(workers)
+        ]
+        totals = np.zeros((len(clients), etf_table.shape[1]))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for offset, result in pool.map(_aggregate_chunk, tasks):
+                totals[offset:offset + len(result)] = result
+    else:
+        totals = aggregate_holdings(client_idx, etf_idx, shares, etf_table, len(clients))
+
+    total_cost = totals[:, 0]
+    monthly = totals[:, 1:]
+    annual_dividends = monthly.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dividend_yield = np.where(total_cost > 0, annual_dividends / total_cost * 100, 0.0)
+
+    reports = pd.DataFrame({
+        '客戶': clients,
+        '總投資金額': total_cost,
+        '預估年配息': annual_dividends,
+        '平均報酬率(%)': dividend_yield,
+    })
+    reports[MONTH_COLUMNS] = monthly
+    reports['未知代號數'] = unknown_counts
+    return reports
+
+def read_holdings(path):
+    if path.endswith('.parquet'):
+        holdings = pd.read_parquet(path, columns=['client', 'code', 'shares'])
+    else:
+        holdings = try_read_csv(path, usecols=['client', 'code', 'shares'], dtype={'client': str, 'code': str})
+    return holdings
+
+def write_reports(reports, path):
+    if path.endswith('.csv'):
+        reports.to_csv(path, index=False, encoding='utf-8')
+    else:
+        reports.to_parquet(path, index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="批次計算客戶投資組合配息報表")
+    parser.add_argument('holdings', help="持股檔 (CSV 或 Parquet)，欄位為 client, code, shares")
+    parser.add_argument('-o', '--output', default='portfolio_reports.parquet', help="輸出檔 (預設 Parquet，副檔名 .csv 則輸出 CSV)")
+    parser.add_argument('--data', default=None, help="ETF 配息資料 CSV，預設為 etf_dividend_022.csv")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help="大量資料時使用的工作程序數")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    analyzer = ClassifiedDividendAnalyzer(args.data)
+    for message in analyzer.errors:
+        print(message)
+    if analyzer.data is None:
+        raise SystemExit(1)
+    holdings = read_holdings(args.holdings)
+    reports = compute_reports(holdings, analyzer, workers=args.workers)
+    write_reports(reports, args.output)
+    print(f"已輸出 {len(reports):,} 筆客戶報表至 {args.output}（{time.perf_counter() - start:.2f} 秒）")
+
+if __name__ == "__main__":
+    main()
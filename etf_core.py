@@ -0,0 +1,435 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+#########################################
+# 不依賴 Streamlit 的 ETF 配息分析核心
+# app.py 與批次報表 (batch_report.py) 共用
+#########################################
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'etf_dividend_022.csv')
+
+#########################################
+# 多重編碼讀取 CSV 函式
+#########################################
+def try_read_csv(file_path, **kwargs):
+    encodings = ['cp950', 'big5', 'utf-8', 'latin1']
+    last_exception = None
+    for enc in encodings:
+        try:
+            df = pd.read_csv(file_path, encoding=enc, **kwargs)
+            return df
+        except Exception as e:
+            last_exception = e
+    raise last_exception
+
+def format_etf_code(code):
+    code = str(code).strip()
+    if len(code) < 5 and 'B' not in code:
+        code = code.zfill(5)
+    return code
+
+# CSV 中的代號已去掉前導零，分析器補零到 5 碼；以下為補零結果與交易所代號不同的ETF
+EXCHANGE_CODES = {
+    '00050': '0050', '00051': '0051', '00052': '0052', '00053': '0053',
+    '00055': '0055', '00056': '0056', '00057': '0057', '00061': '0061',
+    '06201': '006201', '06203': '006203', '06204': '006204', '06205': '006205',
+    '06206': '006206', '06207': '006207', '06208': '006208',
+}
+
+# 已知掛牌市場的ETF (Yahoo 代號)；其餘代號由呼叫端決定市場
+QUOTE_SYMBOLS = {
+    '0050': '0050.TW', '0051': '0051.TW', '0052': '0052.TW', '0053': '0053.TW',
+    '0055': '0055.TW', '0056': '0056.TW', '0057': '0057.TW', '0061': '0061.TW',
+    '006201': '006201.TWO', '006203': '006203.TW', '006204': '006204.TW', '006205': '006205.TW',
+    '006206': '006206.TW', '006207': '006207.TW', '006208': '006208.TW',
+}
+
+def to_exchange_code(etf_code):
+    # 分析器、投資組合與歷史價格庫共用的交易所代號 (例如 00050 -> 0050、06208 -> 006208)
+    code = format_etf_code(etf_code)
+    return EXCHANGE_CODES.get(code, code)
+
+def payout_amounts(data):
+    # 配息金額以 float32 存放，取用時還原為 float64（原始資料最多 4 位小數）
+    return np.round(data['每單位配發金額(元)'].to_numpy(dtype=float), 6)
+
+def read_only_frame(frame):
+    # 將每個欄位的底層陣列設為不可寫入，對共用資料表的就地修改會直接拋出 ValueError
+    columns = {}
+    for column in frame.columns:
+        values = frame[column].array
+        if isinstance(values, pd.Categorical):
+            codes = values.codes.copy()
+            codes.flags.writeable = False
+            values = pd.Categorical.from_codes(codes, dtype=values.dtype)
+        else:
+            values = frame[column].to_numpy(copy=True)
+            values.flags.writeable = False
+        columns[column] = pd.Series(values, index=frame.index, copy=False)
+    return pd.DataFrame(columns, copy=False)
+
+#########################################
+# ETF 配息分析器核心類別
+# 讀取或欄位錯誤不直接顯示，記錄於 self.errors 交由呼叫端處理
+# CSV 只讀取一次並精簡存放：代號/名稱/標籤為 category、月份 int8、配息金額 float32，
+# 未使用的欄位 (年度、發放月份_x/_y、分類標籤) 不載入；
+# 建立後 data/price_data 的底層陣列設為唯讀，可供多個工作階段共用，所有方法皆回傳新的結果而不修改資料表
+#########################################
+DATA_COLUMNS = ['股票代號', '股票名稱', '除息日', '每單位配發金額(元)', '收益分配基準日', '收盤價']
+QUARTERLY_LABELS = {
+    (1, 4, 7, 10): '季配息(1,4,7,10月)',
+    (2, 5, 8, 11): '季配息(2,5,8,11月)',
+    (3, 6, 9, 12): '季配息(3,6,9,12月)',
+}
+
+class ClassifiedDividendAnalyzer:
+    def __init__(self, csv_path=None):
+        unified_file = csv_path or DEFAULT_CSV
+        self.data_path = os.path.dirname(os.path.abspath(unified_file))
+        self.errors = []
+        self.price_data = None
+        self.data = None
+        try:
+            raw = try_read_csv(unified_file, usecols=lambda column: column in DATA_COLUMNS, dtype={'股票代號': str})
+            raw['股票代號'] = raw['股票代號'].astype(str).str.strip().map(format_etf_code).astype('category')
+            raw['股票名稱'] = raw['股票名稱'].astype('category')
+        except Exception as e:
+            self.errors.append("讀取配息數據時發生錯誤: " + str(e))
+            return
+        try:
+            # 每檔ETF一列的價格表（與原本相同，取每檔第一筆有效收盤價）
+            prices = pd.to_numeric(raw['收盤價'], errors='coerce')
+            self.price_data = (raw.loc[prices.notna(), ['股票代號', '股票名稱']]
+                               .assign(收盤價=prices[prices.notna()])
+                               .drop_duplicates('股票代號')
+                               .reset_index(drop=True))
+        except Exception as e:
+            self.errors.append("讀取價格數據時發生錯誤: " + str(e))
+        try:
+            ex_dates = pd.to_datetime(raw['除息日'], errors='coerce')
+            valid = ex_dates.notna()
+            data = raw.loc[valid, [column for column in raw.columns if column != '收盤價']]
+            data['除息日'] = ex_dates[valid]
+            data['月份'] = data['除息日'].dt.month.astype(np.int8)
+            if '收益分配基準日' in data.columns:
+                data['收益分配基準日'] = pd.to_datetime(data['收益分配基準日'], errors='coerce')
+                data['發放月份'] = data['收益分配基準日'].dt.month.fillna(data['月份']).astype(np.int8)
+            else:
+                data['發放月份'] = data['月份']
+            if '每單位配發金額(元)' in data.columns:
+                data['每單位配發金額(元)'] = pd.to_numeric(data['每單位配發金額(元)'], errors='coerce').astype(np.float32)
+            self.data = data.reset_index(drop=True)
+            self.classify_dividends()
+        except Exception as e:
+            self.errors.append("讀取配息數據時發生錯誤: " + str(e))
+            self.data = None
+        if self.data is not None:
+            self.data = read_only_frame(self.data)
+        if self.price_data is not None:
+            self.price_data = read_only_frame(self.price_data)
+        self._price_rows = {}
+        if self.price_data is not None:
+            self._price_rows = {code: row for row, code in enumerate(self.price_data['股票代號'])}
+
+    def format_etf_code(self, code):
+        return format_etf_code(code)
+
+    def classify_dividends(self):
+        if self.data is None:
+            return
+        grouped = self.data.groupby('股票代號', observed=True)['月份']
+        counts = grouped.size()
+        month_sets = grouped.agg(lambda months: tuple(sorted(months.unique().tolist())))
+        labels = pd.Series('不定期', index=counts.index)
+        labels[counts >= 12] = '月月配'
+        quarterly = month_sets.map(QUARTERLY_LABELS.get)
+        labels[(counts == 4) & quarterly.notna()] = quarterly
+        labels[counts == 2] = '半年配'
+        labels[counts == 1] = '年配'
+        self.data['發放標籤'] = self.data['股票代號'].map(labels).astype('category')
+        if '每單位配發金額(元)' not in self.data.columns:
+            self.errors.append("CSV 缺少「每單位配發金額(元)」欄位，請確認。")
+
+    def memory_usage(self):
+        # 分析器持有的資料表大小 (bytes)
+        total = 0
+        for frame in (self.data, self.price_data):
+            if frame is not None:
+                total += int(frame.memory_usage(deep=True).sum())
+        return total
+
+    def get_etfs_by_dividend_frequency(self):
+        if self.data is None:
+            return {}
+        freq_map = {}
+        for freq in self.data['發放標籤'].unique():
+            freq_map[freq] = sorted(self.data.loc[self.data['發放標籤'] == freq, '股票代號'].unique())
+        return freq_map
+
+    def get_all_etfs(self):
+        if self.data is not None and self.price_data is not None:
+            data_codes = set(self.data['股票代號'].astype(str))
+            valid_etfs = data_codes.intersection(self._price_rows)
+            return sorted(list(valid_etfs))
+        return []
+
+    def get_etf_name(self, etf_code):
+        etf_code = self.format_etf_code(etf_code)
+        row = self._price_rows.get(etf_code)
+        if row is not None:
+            return self.price_data['股票名稱'].iat[row]
+        elif self.data is not None:
+            mask = self.data['股票代號'] == etf_code
+            if mask.any():
+                return self.data['股票名稱'][mask].iloc[0]
+        return f"ETF {etf_code}"
+
+    def get_etf_price(self, etf_code):
+        row = self._price_rows.get(self.format_etf_code(etf_code))
+        if row is not None:
+            return float(self.price_data['收盤價'].iat[row])
+        return None
+
+    def calculate_investment_cost(self, portfolio, prices=None):
+        # prices 可傳入 {ETF代號: 價格} 覆蓋 CSV 收盤價（例如即時報價）
+        total_cost = 0
+        details = []
+        for etf, quantity in portfolio.items():
+            price = prices[etf] if prices and etf in prices else self.get_etf_price(etf)
+            if price is not None:
+                cost = price * quantity
+                details.append({
+                    "ETF代號": etf,
+                    "ETF名稱": self.get_etf_name(etf),
+                    "購買數量（千股）": f"{quantity/1000:.1f}",
+                    "實際股數": f"{quantity:,}",
+                    "收盤價": f"{price:.2f}",
+                    "投資金額": f"NT${cost:,.0f}"
+                })
+                total_cost += cost
+        return total_cost, details
+
+    def get_monthly_dividends(self, portfolio):
+        # 配息金額需乘上各自持股數，只能另建結果；僅取出投資組合的列與繪圖所需的三個欄位，不複製整份資料表
+        if self.data is None or not portfolio:
+            return None
+        mask = self.data['股票代號'].isin(portfolio.keys()).to_numpy()
+        codes = self.data['股票代號'].to_numpy()[mask].astype(str)
+        quantities = np.array([portfolio[code] for code in codes], dtype=float)
+        amounts = payout_amounts(self.data)[mask]
+        return pd.DataFrame({
+            '股票代號': codes,
+            '月份': self.data['月份'].to_numpy()[mask],
+            '每千單位配發金額': amounts * quantities,
+        })
+
+    def get_price_series(self):
+        # 以ETF代號為索引的收盤價
+        if self.price_data is None:
+            return pd.Series(dtype=float)
+        return pd.Series(self.price_data['收盤價'].to_numpy(), index=self.price_data['股票代號'].astype(str))
+
+    def get_payout_schedule(self, etf_codes, month_column='發放月份'):
+        # 回傳 (ETF數, 12) 陣列：各ETF每單位於各月份的配息金額
+        payouts = np.zeros((len(etf_codes), 12))
+        if self.data is None or not etf_codes:
+            return payouts
+        rows = pd.Index(etf_codes).get_indexer(self.data['股票代號'])
+        mask = rows >= 0
+        months = self.data[month_column].to_numpy()[mask].astype(int) - 1
+        amounts = payout_amounts(self.data)[mask]
+        np.add.at(payouts, (rows[mask], months), np.nan_to_num(amounts))
+        return payouts
+
+    def get_payout_table(self):
+        # 全部ETF的每單位價格與各除息月份配息，回傳 (代號 Index, 價格陣列, (ETF數, 12) 配息陣列)
+        if self.data is None:
+            return pd.Index([]), np.zeros(0), np.zeros((0, 12))
+        codes = pd.Index(sorted(self.data['股票代號'].unique()))
+        prices = self.get_price_series().reindex(codes).fillna(0).to_numpy(dtype=float)
+        return codes, prices, self.get_payout_schedule(list(codes), month_column='月份')
+
+    def portfolio_metrics(self, portfolio, prices=None):
+        # 與頁面上「總投資金額 / 預估年配息 / 平均報酬率 / 月度配息」相同的數值
+        total_cost, _ = self.calculate_investment_cost(portfolio, prices)
+        codes = list(portfolio.keys())
+        shares = np.array([portfolio[etf] for etf in codes], dtype=float)
+        monthly = shares @ self.get_payout_schedule(codes, month_column='月份') if codes else np.zeros(12)
+        annual_dividends = float(monthly.sum())
+        dividend_yield = (annual_dividends / total_cost * 100) if total_cost > 0 else 0
+        return {
+            'total_cost': total_cost,
+            'annual_dividends': annual_dividends,
+            'dividend_yield': dividend_yield,
+            'monthly_dividends': monthly,
+        }
+
+#########################################
+# 除息行事曆：以排序後的日期索引做區間查詢
+# 資料僅含最近一個年度的配息，因此以「月/日」為鍵，將事件投影到查詢區間所在年份
+#########################################
+CALENDAR_COLUMNS = ['除息日', '收益分配基準日']
+_LEAP_MONTH_START = np.cumsum([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+
+def _day_key(month, day):
+    # 以閏年曆法換算的年內序號 (0~365)，不同年份的同一月日對應相同鍵值
+    return _LEAP_MONTH_START[np.asarray(month) - 1] + np.asarray(day) - 1
+
+class DividendCalendar:
+    def __init__(self, data):
+        self.indexes = {}
+        self.code_indexes = {}
+        if data is None:
+            return
+        for column in CALENDAR_COLUMNS:
+            if column not in data.columns:
+                continue
+            dates = pd.to_datetime(data[column], errors='coerce')
+            valid = dates.notna().to_numpy()
+            keys = _day_key(dates[valid].dt.month.to_numpy(), dates[valid].dt.day.to_numpy())
+            order = np.argsort(keys, kind='stable')
+            codes = data['股票代號'].to_numpy()[valid][order]
+            self.indexes[column] = {
+                'keys': keys[order],
+                'months': dates[valid].dt.month.to_numpy()[order],
+                'days': dates[valid].dt.day.to_numpy()[order],
+                'codes': codes,
+                'names': data['股票名稱'].to_numpy()[valid][order],
+                'amounts': payout_amounts(data)[valid][order],
+            }
+            # 各ETF於全域排序陣列中的位置（本身仍依鍵值排序），供投資組合查詢使用
+            code_positions = pd.Series(np.arange(len(codes))).groupby(codes).indices
+            self.code_indexes[column] = {
+                code: (self.indexes[column]['keys'][positions], positions)
+                for code, positions in code_positions.items()
+            }
+
+    def _segments(self, start, end):
+        # 將 [start, end] 切成不跨年的片段，回傳 (年份, 起始鍵, 結束鍵)
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        for year in range(start.year, end.year + 1):
+            seg_start = max(start, pd.Timestamp(year, 1, 1))
+            seg_end = min(end, pd.Timestamp(year, 12, 31))
+            yield year, _day_key(seg_start.month, seg_start.day), _day_key(seg_end.month, seg_end.day)
+
+    def _build_events(self, index, positions, years):
+        if len(positions) == 0:
+            return pd.DataFrame(columns=['日期', '股票代號', '股票名稱', '每單位配發金額(元)'])
+        months, days = index['months'][positions], index['days'][positions]
+        # 非閏年的 2/29 事件以 2/28 代替
+        leap = (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+        days = np.where((months == 2) & (days == 29) & ~leap, 28, days)
+        dates = pd.to_datetime(pd.DataFrame({'year': years, 'month': months, 'day': days}))
+        events = pd.DataFrame({
+            '日期': dates,
+            '股票代號': index['codes'][positions],
+            '股票名稱': index['names'][positions],
+            '每單位配發金額(元)': index['amounts'][positions],
+        })
+        return events.sort_values(['日期', '股票代號'], kind='stable').reset_index(drop=True)
+
+    def events_between(self, start, end, column='除息日', codes=None):
+        # 二分搜尋找出區間內事件：全體 O(log n + k)，指定ETF時為各ETF的 O(log n_i + k_i)
+        index = self.indexes.get(column)
+        if index is None:
+            return self._build_events({}, [], np.array([], dtype=int))
+        positions, years = [], []
+        for year, lo_key, hi_key in self._segments(start, end):
+            if codes is None:
+                lo = np.searchsorted(index['keys'], lo_key, side='left')
+                hi = np.searchsorted(index['keys'], hi_key, side='right')
+                found = np.arange(lo, hi)
+            else:
+                found = []
+                for code in codes:
+                    code_index = self.code_indexes[column].get(code)
+                    if code_index is None:
+                        continue
+                    code_keys, code_positions = code_index
+                    lo = np.searchsorted(code_keys, lo_key, side='left')
+                    hi = np.searchsorted(code_keys, hi_key, side='right')
+                    found.append(code_positions[lo:hi])
+                found = np.concatenate(found) if found else np.array([], dtype=int)
+            positions.append(found)
+            years.append(np.full(len(found), year))
+        positions = np.concatenate(positions) if positions else np.array([], dtype=int)
+        years = np.concatenate(years) if years else np.array([], dtype=int)
+        return self._build_events(index, positions, years)
+
+    def portfolio_cash_flows(self, portfolio, start, end, column='收益分配基準日'):
+        # 投資組合在區間內每筆配息的入帳金額（portfolio 為 {ETF代號: 實際股數}）
+        events = self.events_between(start, end, column=column, codes=list(portfolio.keys()))
+        events['股數'] = events['股票代號'].map(portfolio).astype(float)
+        events['配息金額'] = events['股數'] * events['每單位配發金額(元)']
+        return events
+
+#########################################
+# 多條件ETF篩選器：每份資料只計算一次的ETF特徵表
+# 配息月份存成 12 位元遮罩，數值欄位另存排序索引，區間條件以二分搜尋取得
+#########################################
+SCREENER_RANGE_COLUMNS = ['殖利率(%)', '收盤價']
+
+class ETFScreener:
+    def __init__(self, analyzer):
+        self.features = self._build_features(analyzer)
+        self.month_bits = self.features['配息月份遮罩'].to_numpy(dtype=np.uint16)
+        self.sorted_columns = {}
+        for column in SCREENER_RANGE_COLUMNS:
+            values = self.features[column].to_numpy(dtype=float)
+            order = np.argsort(values, kind='stable')
+            self.sorted_columns[column] = (values[order], order)
+
+    def _build_features(self, analyzer):
+        codes = analyzer.get_all_etfs()
+        if not codes:
+            return pd.DataFrame(columns=['股票代號', '股票名稱', '收盤價', '年配息', '殖利率(%)',
+                                         '發放標籤', '配息次數', '配息穩定度(%)', '配息月份遮罩'])
+        data = analyzer.data[analyzer.data['股票代號'].isin(codes)]
+        keys = data['股票代號'].astype(str)
+        grouped = data.groupby(keys)
+        amounts = pd.Series(payout_amounts(data), index=data.index).groupby(keys)
+        prices = analyzer.get_price_series().reindex(codes)
+        month_bits = grouped['月份'].agg(
+            lambda months: np.bitwise_or.reduce(1 << (months.to_numpy(dtype=np.int64) - 1))
+        )
+        features = pd.DataFrame({
+            '股票代號': codes,
+            '股票名稱': grouped['股票名稱'].first().reindex(codes).to_numpy(),
+            '收盤價': prices.to_numpy(dtype=float),
+            '年配息': amounts.sum().reindex(codes).to_numpy(dtype=float),
+            '發放標籤': grouped['發放標籤'].first().reindex(codes).to_numpy(),
+            '配息次數': grouped.size().reindex(codes).to_numpy(),
+            # 配息穩定度：最低一次配息 / 最高一次配息，每次金額相同為 100%
+            '配息穩定度(%)': (amounts.min() / amounts.max()).reindex(codes).fillna(0).to_numpy(dtype=float) * 100,
+            '配息月份遮罩': month_bits.reindex(codes).fillna(0).to_numpy(dtype=np.uint16),
+        })
+        features['殖利率(%)'] = np.where(features['收盤價'] > 0, features['年配息'] / features['收盤價'] * 100, 0.0)
+        return features
+
+    def _range_mask(self, column, low=None, high=None):
+        values, order = self.sorted_columns[column]
+        lo = 0 if low is None else np.searchsorted(values, low, side='left')
+        hi = len(values) if high is None else np.searchsorted(values, high, side='right')
+        mask = np.zeros(len(values), dtype=bool)
+        mask[order[lo:hi]] = True
+        return mask
+
+    def screen(self, yield_range=None, price_range=None, frequencies=None, months=None,
+               match_all_months=True, min_consistency=None):
+        mask = np.ones(len(self.features), dtype=bool)
+        if yield_range is not None:
+            mask &= self._range_mask('殖利率(%)', *yield_range)
+        if price_range is not None:
+            mask &= self._range_mask('收盤價', *price_range)
+        if frequencies:
+            mask &= self.features['發放標籤'].isin(frequencies).to_numpy()
+        if months:
+            required = np.uint16(sum(1 << (month - 1) for month in months))
+            if match_all_months:
+                mask &= (self.month_bits & required) == required
+            else:
+                mask &= (self.month_bits & required) != 0
+        if min_consistency is not None:
+            mask &= self.features['配息穩定度(%)'].to_numpy() >= min_consistency
+        return self.features[mask].sort_values('殖利率(%)', ascending=False)
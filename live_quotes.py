@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import requests
+import yfinance as yf
+
+from etf_core import QUOTE_SYMBOLS, ClassifiedDividendAnalyzer, to_exchange_code
+
+#########################################
+# 即時報價：程序共用的 TTL 快取
+# - 多個工作階段同時查詢同一檔時只向上游送出一次請求（request coalescing）
+# - 一次請求批次查詢多檔代號
+# - 過期但仍在容許範圍內的報價先回傳，同時於背景更新（stale-while-revalidate）
+# - 上游查無或出錯的代號記錄失敗時間，退避期間內不再查詢（negative caching）
+# 預設以 yfinance 批次查詢 Yahoo；設定環境變數 LIVE_QUOTE_URL 時改向該網址（例如本機測試用的報價伺服器）查詢
+#########################################
+# QUOTE_SYMBOLS 以外的代號 (含 B/L/R/U/K 後綴) 第一次查詢時同時嘗試上市與上櫃，記住有報價的一方
+QUOTE_MARKETS = ['.TW', '.TWO']
+
+class YahooQuoteFetcher:
+    # 以 yfinance 一次下載多檔近幾日的日線（由 yfinance 處理 Yahoo 的 cookie 與 crumb），取每檔最新一筆收盤價
+    def __init__(self, timeout=5):
+        self.timeout = timeout
+
+    def __call__(self, symbols):
+        frame = yf.download(list(symbols), period='5d', interval='1d', auto_adjust=False,
+                            progress=False, timeout=self.timeout, multi_level_index=True)
+        if frame is None or frame.empty or 'Close' not in frame.columns.get_level_values(0):
+            return {}
+        closes = frame['Close'].ffill().iloc[-1]
+        return {symbol: float(price) for symbol, price in closes.items() if symbol in symbols and pd.notna(price)}
+
+class HttpQuoteFetcher:
+    # 回應格式與 Yahoo v7 quote API 相同：{"quoteResponse": {"result": [{"symbol", "regularMarketPrice"}]}}
+    def __init__(self, url=None, timeout=5):
+        self.url = url or os.environ['LIVE_QUOTE_URL']
+        self.timeout = timeout
+
+    def __call__(self, symbols):
+        response = requests.get(self.url, params={'symbols': ','.join(symbols)}, timeout=self.timeout)
+        response.raise_for_status()
+        results = response.json().get('quoteResponse', {}).get('result', [])
+        return {
+            item['symbol']: float(item['regularMarketPrice'])
+            for item in results
+            if item.get('regularMarketPrice') is not None
+        }
+
+def default_fetcher():
+    if os.environ.get('LIVE_QUOTE_URL'):
+        return HttpQuoteFetcher()
+    return YahooQuoteFetcher()
+
+class LiveQuoteCache:
+    def __init__(self, fetcher=None, ttl=60, stale_ttl=300, max_backoff=900, max_batch=50, clock=time.monotonic):
+        self.fetcher = fetcher or default_fetcher()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_backoff = max_backoff
+        self.max_batch = max_batch
+        self.clock = clock
+        self.stats = {'upstream_calls': 0, 'hits': 0, 'stale_hits': 0, 'negative_hits': 0, 'coalesced': 0, 'errors': 0}
+        self._quotes = {}
+        self._failures = {}
+        self._resolved = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='quote-refresh')
+
+    def get_quotes(self, symbols, timeout=10):
+        # 回傳 {代號: 價格}，取不到報價的代號不會出現在結果中
+        # 上游查無或出錯的代號在退避期間內不再查詢，有舊報價時繼續回傳舊報價
+        now = self.clock()
+        result, waiting, to_fetch, to_refresh = {}, {}, [], []
+        with self._lock:
+            for symbol in dict.fromkeys(symbols):
+                entry = self._quotes.get(symbol)
+                age = now - entry[1] if entry else None
+                failure = self._failures.get(symbol)
+                if entry and age < self.ttl:
+                    result[symbol] = entry[0]
+                    self.stats['hits'] += 1
+                elif failure and now < failure[0]:
+                    if entry and age < self.ttl + self.stale_ttl:
+                        result[symbol] = entry[0]
+                    self.stats['negative_hits'] += 1
+                elif entry and age < self.ttl + self.stale_ttl:
+                    result[symbol] = entry[0]
+                    self.stats['stale_hits'] += 1
+                    if symbol not in self._inflight:
+                        self._inflight[symbol] = Future()
+                        to_refresh.append(symbol)
+                elif symbol in self._inflight:
+                    waiting[symbol] = self._inflight[symbol]
+                    self.stats['coalesced'] += 1
+                else:
+                    waiting[symbol] = self._inflight[symbol] = Future()
+                    to_fetch.append(symbol)
+        # 已需要同步查詢時，過期的代號併入同一批次，不另外送背景請求
+        if to_fetch:
+            self._fetch(to_fetch + to_refresh)
+        elif to_refresh:
+            self._refresher.submit(self._fetch, to_refresh)
+        for symbol, future in waiting.items():
+            try:
+                price = future.result(timeout)
+            except Exception:
+                price = None
+            if price is not None:
+                result[symbol] = price
+        return result
+
+    def get_prices(self, etf_codes, timeout=10):
+        # 以分析器代號查詢，回傳 {ETF代號: 價格}；市場未知的代號上市/上櫃一併放入同一批次
+        candidates = {etf_code: self._candidates(etf_code) for etf_code in dict.fromkeys(etf_codes)}
+        quotes = self.get_quotes([symbol for symbols in candidates.values() for symbol in symbols], timeout=timeout)
+        prices = {}
+        for etf_code, symbols in candidates.items():
+            symbol = next((symbol for symbol in symbols if symbol in quotes), None)
+            if symbol is None:
+                continue
+            prices[etf_code] = quotes[symbol]
+            if len(symbols) > 1:
+                with self._lock:
+                    self._resolved[to_exchange_code(etf_code)] = symbol
+        return prices
+
+    def _candidates(self, etf_code):
+        code = to_exchange_code(etf_code)
+        symbol = QUOTE_SYMBOLS.get(code) or self._resolved.get(code)
+        return [symbol] if symbol else [code + market for market in QUOTE_MARKETS]
+
+    def _fetch(self, symbols):
+        for start in range(0, len(symbols), self.max_batch):
+            batch = symbols[start:start + self.max_batch]
+            with self._lock:
+                self.stats['upstream_calls'] += 1
+            try:
+                prices = self.fetcher(batch)
+            except Exception as e:
+                print(f"取得即時報價時出錯: {str(e)}")
+                prices = {}
+                with self._lock:
+                    self.stats['errors'] += 1
+            fetched_at = self.clock()
+            with self._lock:
+                for symbol in batch:
+                    price = prices.get(symbol)
+                    if price is not None:
+                        self._quotes[symbol] = (price, fetched_at)
+                        self._failures.pop(symbol, None)
+                    else:
+                        # 查無或出錯：至少 TTL 後才重試，連續失敗時退避時間加倍
+                        count = self._failures[symbol][1] + 1 if symbol in self._failures else 1
+                        delay = min(self.ttl * 2 ** (count - 1), self.max_backoff)
+                        self._failures[symbol] = (fetched_at + delay, count)
+                    future = self._inflight.pop(symbol, None)
+                    if future is not None:
+                        future.set_result(price)
+
+#########################################
+# 本機測試用報價伺服器：以 CSV 收盤價加上隨機波動回應，並統計請求次數
+#########################################
+def make_stub_handler(base_prices, delay, counter):
+    class StubQuoteHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            symbols = [symbol for value in query.get('symbols', []) for symbol in value.split(',') if symbol]
+            time.sleep(delay)
+            results = [
+                {'symbol': symbol, 'regularMarketPrice': round(base_prices[symbol] * random.uniform(0.98, 1.02), 2)}
+                for symbol in symbols if symbol in base_prices
+            ]
+            with counter['lock']:
+                counter['requests'] += 1
+                counter['symbols'] += len(symbols)
+                print(f"第 {counter['requests']} 次請求，{len(symbols)} 檔代號")
+            body = json.dumps({'quoteResponse': {'result': results}}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubQuoteHandler
+
+def run_stub_server(port=8765, delay=0.2):
+    analyzer = ClassifiedDividendAnalyzer()
+    # 模擬上市/上櫃：已知市場依對照表，債券ETF放在上櫃，其餘上市
+    base_prices = {}
+    for code in analyzer.get_all_etfs():
+        exchange_code = to_exchange_code(code)
+        symbol = QUOTE_SYMBOLS.get(exchange_code) or exchange_code + ('.TWO' if exchange_code.endswith('B') else '.TW')
+        base_prices[symbol] = analyzer.get_etf_price(code)
+    counter = {'requests': 0, 'symbols': 0, 'lock': threading.Lock()}
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_stub_handler(base_prices, delay, counter))
+    print(f"測試報價伺服器已啟動：LIVE_QUOTE_URL=http://127.0.0.1:{port}/quote")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="啟動本機測試用報價伺服器")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.2, help="模擬上游延遲秒數")
+    args = parser.parse_args()
+    run_stub_server(args.port, args.delay)
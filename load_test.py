@@ -0,0 +1,293 @@
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.NumberInput_pb2 import NumberInput
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from streamlit.runtime.state.common import user_key_from_element_id
+from tornado.websocket import websocket_connect
+
+from etf_core import ClassifiedDividendAnalyzer
+
+#########################################
+# 多使用者壓力測試：在本機啟動一個 streamlit run 伺服器，
+# 以無頭客戶端（與瀏覽器相同的 websocket 協定）同時開啟多個工作階段，
+# 所有工作階段共用同一個程序內的分析器與報價快取；
+# 記錄每次 rerun 的延遲、工作階段實際重疊的程度與伺服器程序的記憶體，
+# 不需網路，直接使用內附 CSV
+#########################################
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+PERCENTILES = [50, 95, 99]
+
+class HeadlessSession:
+    # 每次 rerun 送出 rerun_script，收集 ForwardMsg 直到 script_finished
+    # 已設定過的元件狀態每次都完整送出（與瀏覽器相同），按鈕的 trigger 只送一次
+    def __init__(self, url):
+        self.url = url
+        self.connection = None
+        self.widgets = []
+        self.exceptions = []
+        self._states = {}
+        self._messages = {}
+
+    async def connect(self):
+        ws_url = 'ws' + self.url[len('http'):].rstrip('/') + '/_stcore/stream'
+        self.connection = await websocket_connect(ws_url, subprotocols=['streamlit'])
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+    async def rerun(self, trigger=None):
+        msg = BackMsg()
+        msg.rerun_script.widget_states.widgets.extend(
+            list(self._states.values()) + ([trigger] if trigger is not None else [])
+        )
+        await self.connection.write_message(msg.SerializeToString(), binary=True)
+        while True:
+            payload = await self.connection.read_message()
+            if payload is None:
+                raise ConnectionError("伺服器已中斷連線")
+            forward = ForwardMsg()
+            forward.ParseFromString(payload)
+            kind = forward.WhichOneof('type')
+            # 伺服器對已送過的訊息只傳雜湊值，由客戶端自行保存內容
+            if kind == 'ref_hash':
+                forward = self._messages[forward.ref_hash]
+                kind = forward.WhichOneof('type')
+            elif forward.metadata.cacheable:
+                self._messages[forward.hash] = forward
+            if kind == 'new_session':
+                self.widgets, self.exceptions = [], []
+            elif kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                name = element.WhichOneof('type')
+                proto = getattr(element, name)
+                if name == 'exception':
+                    self.exceptions.append(proto.message)
+                elif 'id' in proto.DESCRIPTOR.fields_by_name and proto.id:
+                    self.widgets.append((name, proto))
+            elif kind == 'script_finished':
+                if forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    return
+
+    def find(self, name, key=None, label=None):
+        for widget_name, proto in self.widgets:
+            if widget_name != name:
+                continue
+            if key is not None and user_key_from_element_id(proto.id) == key:
+                return proto
+            if label is not None and proto.label == label:
+                return proto
+        raise LookupError(f"找不到元件 {name} ({key or label})")
+
+    def set_value(self, name, value, key=None, label=None):
+        proto = self.find(name, key, label)
+        state = WidgetState(id=proto.id)
+        if name in ('radio', 'selectbox'):
+            # 選項為 format_func 處理後的文字，ETF 選單以「代號 (名稱)」比對
+            options = list(proto.options)
+            state.int_value = next(
+                index for index, option in enumerate(options)
+                if option == value or option.startswith(f"{value} (")
+            )
+        elif name == 'text_input':
+            state.string_value = value
+        elif name == 'number_input':
+            if proto.data_type == NumberInput.INT:
+                state.int_value = int(value)
+            else:
+                state.double_value = float(value)
+        elif name == 'checkbox':
+            state.bool_value = bool(value)
+        else:
+            raise ValueError(f"不支援的元件類型: {name}")
+        self._states[proto.id] = state
+        return self.rerun()
+
+    def click(self, key):
+        proto = self.find('button', key=key)
+        return self.rerun(WidgetState(id=proto.id, trigger_value=True))
+
+async def run_session(session, etf_codes, holdings, rng, start, timeout, live_quotes, intervals):
+    # 模擬一位使用者：搜尋並添加 holdings 檔ETF、輸入持股數量，再操作存股計算、行事曆與篩選器
+    # st.tabs 的切換只在瀏覽器端進行，不會觸發 rerun，因此以操作各分頁內的元件代替
+    latencies = []
+    errors = []
+
+    async def timed(action, rerun):
+        begin = time.perf_counter()
+        try:
+            await asyncio.wait_for(rerun(), timeout)
+        except (asyncio.TimeoutError, LookupError, StopIteration) as e:
+            errors.append(f"{action}: {type(e).__name__} {e}")
+        end = time.perf_counter()
+        latencies.append((action, end - begin))
+        intervals.append((begin, end))
+        if session.exceptions:
+            errors.append(f"{action}: {session.exceptions[0]}")
+
+    await session.connect()
+    await start.wait()
+    await timed('首次載入', session.rerun)
+    if live_quotes:
+        await timed('開啟即時報價', lambda: session.set_value('checkbox', True, key='live_prices'))
+    await timed('切換搜尋方式', lambda: session.set_value('radio', '搜尋ETF', key='search_method'))
+    selected = rng.sample(etf_codes, min(holdings, len(etf_codes)))
+    for etf in selected:
+        await timed('搜尋ETF', lambda: session.set_value('text_input', etf, label='輸入ETF代號或關鍵字'))
+        await timed('選擇ETF', lambda: session.set_value('selectbox', etf, label='選擇ETF'))
+        await timed('添加ETF', lambda: session.click('btn_add_etf_search2'))
+    for etf in selected:
+        quantity = rng.choice([0.5, 1.0, 2.0, 5.0, 10.0])
+        await timed('輸入持股', lambda: session.set_value('number_input', quantity, key=f'qty_{etf}'))
+    await timed('配息再投入模擬', lambda: session.set_value('radio', '配息再投入模擬', key='calc_mode'))
+    await timed('除息行事曆', lambda: session.set_value('radio', '我的投資組合', key='calendar_scope'))
+    await timed('多條件篩選', lambda: session.set_value('radio', '多條件篩選', key='search_method'))
+    session.close()
+    return latencies, errors
+
+def process_rss_mb(pid):
+    # 讀取 /proc 中的 VmRSS；非 Linux 環境回傳 None
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+async def sample_rss(pid, samples, stop):
+    while not stop.is_set():
+        rss = process_rss_mb(pid)
+        if rss is not None:
+            samples.append(rss)
+        await asyncio.sleep(0.1)
+
+def start_server(port, app_path=APP_PATH):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', app_path,
+         '--server.headless', 'true', '--server.port', str(port),
+         '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"streamlit 伺服器啟動失敗 (exit code {process.returncode})")
+        try:
+            if requests.get(f"{url}/_stcore/health", timeout=1).ok:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("等待 streamlit 伺服器啟動逾時")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def concurrency(intervals, elapsed):
+    # 回傳 (平均同時進行的 rerun 數, 最多同時進行的 rerun 數)
+    events = sorted([(begin, 1) for begin, _ in intervals] + [(end, -1) for _, end in intervals])
+    active = peak = 0
+    for _, step in events:
+        active += step
+        peak = max(peak, active)
+    busy = sum(end - begin for begin, end in intervals)
+    return busy / elapsed if elapsed > 0 else 0, peak
+
+def summarize(latencies):
+    frame = pd.DataFrame(latencies, columns=['action', 'seconds'])
+    frame['ms'] = frame['seconds'] * 1000
+    rows = []
+    for action, group in [('全部', frame)] + list(frame.groupby('action', sort=False)):
+        values = np.percentile(group['ms'], PERCENTILES)
+        rows.append([action, len(group)] + values.round(1).tolist())
+    return pd.DataFrame(rows, columns=['操作', '次數'] + [f'p{p} (ms)' for p in PERCENTILES])
+
+async def run_load_test(url, server_pid, args):
+    etf_codes = ClassifiedDividendAnalyzer().get_all_etfs()
+    start = asyncio.Event()
+    stop = asyncio.Event()
+    intervals = []
+    rss_samples = []
+    sessions = [HeadlessSession(url) for _ in range(args.sessions)]
+    tasks = [
+        asyncio.create_task(run_session(session, etf_codes, args.holdings, random.Random(args.seed + session_id),
+                                        start, args.timeout, args.live_quotes, intervals))
+        for session_id, session in enumerate(sessions)
+    ]
+    # 所有工作階段連線完成後才同時開始，確保 rerun 確實重疊
+    while not all(session.connection for session in sessions):
+        if any(task.done() for task in tasks):
+            break
+        await asyncio.sleep(0.05)
+    idle_rss = process_rss_mb(server_pid) if server_pid else None
+    sampler = asyncio.create_task(sample_rss(server_pid, rss_samples, stop)) if server_pid else None
+    began = time.perf_counter()
+    start.set()
+    reports = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - began
+    stop.set()
+    if sampler is not None:
+        await sampler
+    return reports, intervals, elapsed, idle_rss, rss_samples
+
+def main():
+    parser = argparse.ArgumentParser(description="以多個同時連線的工作階段對 streamlit 伺服器施壓，回報 rerun 延遲與記憶體")
+    parser.add_argument('-n', '--sessions', type=int, default=10, help="同時進行的工作階段數")
+    parser.add_argument('--holdings', type=int, default=20, help="每個工作階段添加的ETF檔數")
+    parser.add_argument('--seed', type=int, default=0, help="隨機種子")
+    parser.add_argument('--timeout', type=float, default=60, help="單次 rerun 逾時秒數")
+    parser.add_argument('--url', help="測試已在執行的伺服器（例如 http://127.0.0.1:8501），不指定則於本機啟動 app.py")
+    parser.add_argument('--server-pid', type=int, help="搭配 --url 指定伺服器程序 PID 以量測記憶體")
+    parser.add_argument('--live-quotes', action='store_true', help="每個工作階段開啟側邊欄即時報價（上游網址沿用 LIVE_QUOTE_URL）")
+    args = parser.parse_args()
+
+    process = None
+    if args.url:
+        url, server_pid = args.url, args.server_pid
+    else:
+        process, url = start_server(free_port())
+        server_pid = process.pid
+    try:
+        reports, intervals, elapsed, idle_rss, rss_samples = asyncio.run(run_load_test(url, server_pid, args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    latencies = [item for latencies, _ in reports for item in latencies]
+    errors = [item for _, session_errors in reports for item in session_errors]
+    average, peak = concurrency(intervals, elapsed)
+    print(f"伺服器: {url}，同時工作階段: {args.sessions}，每階段ETF數: {args.holdings}，總耗時: {elapsed:.1f} 秒")
+    print(f"平均同時進行的 rerun 數: {average:.1f}，最多同時進行: {peak}")
+    print()
+    print(summarize(latencies).to_string(index=False))
+    if rss_samples:
+        print()
+        print(f"伺服器 RSS：連線後閒置 {idle_rss:.1f} MB，峰值 {max(rss_samples):.1f} MB，結束時 {rss_samples[-1]:.1f} MB")
+    if errors:
+        print()
+        print(f"發生 {len(errors)} 個錯誤，前 5 筆：")
+        for error in errors[:5]:
+            print(f"  {error}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
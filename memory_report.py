@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+
+import pandas as pd
+
+from etf_core import DEFAULT_CSV, ClassifiedDividendAnalyzer, format_etf_code, try_read_csv
+from load_test import APP_PATH, HeadlessSession, free_port, process_rss_mb, sample_rss, start_server
+
+#########################################
+# 記憶體報告：比較舊版（兩份完整 object 欄位資料表、每次 rerun 重建）與精簡版資料表
+# 資料表大小直接計算；程序 RSS 則實際啟動多個 streamlit 伺服器，
+# 每個伺服器同時連上多個無頭工作階段操作後量測
+#########################################
+SAMPLE_PORTFOLIO_SIZE = 20
+
+def _frame_bytes(*frames):
+    return sum(int(frame.memory_usage(deep=True).sum()) for frame in frames if frame is not None)
+
+def _sample_portfolio(codes):
+    return {code: 1000 for code in sorted(set(codes))[:SAMPLE_PORTFOLIO_SIZE]}
+
+def _load_legacy():
+    # 重現精簡前 ClassifiedDividendAnalyzer 的載入方式：同一份 CSV 讀兩次並保留所有欄位
+    price_data = try_read_csv(DEFAULT_CSV)
+    price_data['股票代號'] = price_data['股票代號'].astype(str).str.strip().apply(format_etf_code)
+    price_data['收盤價'] = pd.to_numeric(price_data['收盤價'], errors='coerce')
+    price_data = price_data.dropna(subset=['收盤價'])
+    data = try_read_csv(DEFAULT_CSV)
+    data['股票代號'] = data['股票代號'].astype(str).str.strip().apply(format_etf_code)
+    data['除息日'] = pd.to_datetime(data['除息日'], errors='coerce')
+    data = data.dropna(subset=['除息日'])
+    data['月份'] = data['除息日'].dt.month
+    data['發放標籤'] = '不定期'
+    data['每千單位配發金額'] = data['每單位配發金額(元)'] * 1000
+    portfolio = _sample_portfolio(data['股票代號'])
+    filtered_data = data[data['股票代號'].isin(portfolio.keys())].copy()
+    return price_data, data, filtered_data
+
+def _load_compact():
+    analyzer = ClassifiedDividendAnalyzer()
+    portfolio = _sample_portfolio(analyzer.get_all_etfs())
+    return analyzer.price_data, analyzer.data, analyzer.get_monthly_dividends(portfolio)
+
+async def run_workload(session, etf_codes, holdings, rng, start, timeout):
+    # 新舊版 app 共有的操作：搜尋並添加ETF、輸入持股數量；結束前保持連線
+    await session.connect()
+    await start.wait()
+    await asyncio.wait_for(session.rerun(), timeout)
+    await asyncio.wait_for(session.set_value('radio', '搜尋ETF', key='search_method'), timeout)
+    selected = rng.sample(etf_codes, min(holdings, len(etf_codes)))
+    for etf in selected:
+        await asyncio.wait_for(session.set_value('text_input', etf, label='輸入ETF代號或關鍵字'), timeout)
+        await asyncio.wait_for(session.set_value('selectbox', etf, label='選擇ETF'), timeout)
+        await asyncio.wait_for(session.click('btn_add_etf_search2'), timeout)
+    for etf in selected:
+        await asyncio.wait_for(session.set_value('number_input', 1.0, key=f'qty_{etf}'), timeout)
+    return session.exceptions
+
+async def measure_replicas(app_path, replicas, sessions, holdings, seed, timeout):
+    # 啟動 replicas 個伺服器，每個伺服器 sessions 個工作階段同時操作，回傳各伺服器的 RSS
+    servers = []
+    try:
+        for _ in range(replicas):
+            servers.append(start_server(free_port(), app_path))
+        etf_codes = ClassifiedDividendAnalyzer().get_all_etfs()
+        idle = [process_rss_mb(process.pid) for process, _ in servers]
+        start, stop = asyncio.Event(), asyncio.Event()
+        samples = {process.pid: [] for process, _ in servers}
+        samplers = [asyncio.create_task(sample_rss(pid, samples[pid], stop)) for pid in samples]
+        clients = [HeadlessSession(url) for _, url in servers for _ in range(sessions)]
+        tasks = [
+            asyncio.create_task(run_workload(client, etf_codes, holdings, random.Random(seed + index), start, timeout))
+            for index, client in enumerate(clients)
+        ]
+        while not all(client.connection for client in clients) and not any(task.done() for task in tasks):
+            await asyncio.sleep(0.05)
+        start.set()
+        exceptions = [message for result in await asyncio.gather(*tasks) for message in result]
+        end = [process_rss_mb(process.pid) for process, _ in servers]
+        stop.set()
+        await asyncio.gather(*samplers)
+        for client in clients:
+            client.close()
+    finally:
+        for process, _ in servers:
+            process.terminate()
+            process.wait()
+    return {
+        'idle': idle,
+        'peak': [max(samples[process.pid], default=0) for process, _ in servers],
+        'end': end,
+        'exceptions': exceptions,
+    }
+
+def legacy_app_dir(legacy_app):
+    # 舊版 app 從自身所在目錄讀取 CSV，因此複製到暫存目錄並附上 CSV
+    directory = tempfile.mkdtemp(prefix='legacy_app_')
+    shutil.copy(legacy_app, os.path.join(directory, 'app.py'))
+    shutil.copy(DEFAULT_CSV, directory)
+    return directory
+
+def main():
+    parser = argparse.ArgumentParser(description="比較舊版與精簡版 app 的ETF資料表大小與伺服器程序 RSS")
+    parser.add_argument('--legacy-app', help="精簡前的 app.py（例如以 git show <commit>:app.py 匯出）；不指定則只量測目前版本")
+    parser.add_argument('--replicas', type=int, default=2, help="同時執行的 app 程序數")
+    parser.add_argument('--sessions', type=int, default=10, help="每個程序同時操作的工作階段數")
+    parser.add_argument('--holdings', type=int, default=5, help="每個工作階段添加的ETF檔數")
+    parser.add_argument('--seed', type=int, default=0, help="隨機種子")
+    parser.add_argument('--timeout', type=float, default=120, help="單次 rerun 逾時秒數")
+    args = parser.parse_args()
+
+    variants = {'精簡版': APP_PATH}
+    temp_dir = None
+    if args.legacy_app:
+        temp_dir = legacy_app_dir(args.legacy_app)
+        variants = {'舊版': os.path.join(temp_dir, 'app.py'), **variants}
+    try:
+        results = {
+            name: asyncio.run(measure_replicas(path, args.replicas, args.sessions, args.holdings, args.seed, args.timeout))
+            for name, path in variants.items()
+        }
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    frame_kb = {'舊版': _frame_bytes(*_load_legacy()) / 1024, '精簡版': _frame_bytes(*_load_compact()) / 1024}
+    rows = [['ETF資料表大小 (KB)'] + [frame_kb[name] for name in results]]
+    rows.append(['每程序閒置 RSS (MB)'] + [sum(result['idle']) / len(result['idle']) for result in results.values()])
+    rows.append(['每程序峰值 RSS (MB)'] + [sum(result['peak']) / len(result['peak']) for result in results.values()])
+    rows.append(['每程序結束時 RSS (MB)'] + [sum(result['end']) / len(result['end']) for result in results.values()])
+    rows.append([f'整台主機峰值合計，{args.replicas} 個程序 (MB)'] + [sum(result['peak']) for result in results.values()])
+    print(f"每個程序 {args.sessions} 個同時工作階段，每階段添加 {args.holdings} 檔ETF")
+    print(pd.DataFrame(rows, columns=['項目'] + list(results)).round(2).to_string(index=False))
+    for name, result in results.items():
+        if result['exceptions']:
+            print(f"{name} 執行時發生 {len(result['exceptions'])} 個例外，首筆：{result['exceptions'][0]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from etf_core import to_exchange_code
+
+#########################################
+# 本地歷史價格庫：每檔ETF的每日收盤價存成連續的 float32 陣列
+# 所有ETF共用同一條交易日軸 (int32 距 1970-01-01 天數)，收盤價矩陣為 (ETF數, 交易日數)
+# 配息事件稀疏，另以 (列, 日, 金額) 三個陣列保存；代號一律存成交易所代號 (to_exchange_code)
+#########################################
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'price_history.npz')
+TRADING_DAYS_PER_YEAR = 252
+GROWTH_DAYS = 21
+# 同一程序內同時只允許一個更新工作寫入價格庫
+UPDATE_LOCK = threading.Lock()
+
+def _to_days(dates):
+    return pd.DatetimeIndex(dates).tz_localize(None).normalize().values.astype('datetime64[D]').astype(np.int32)
+
+class PriceHistoryStore:
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_PATH
+        self.codes = []
+        self._rows = {}
+        self.n_days = 0
+        self._days = np.zeros(0, dtype=np.int32)
+        self._closes = np.full((0, 0), np.nan, dtype=np.float32)
+        self._div_rows = np.zeros(0, dtype=np.int32)
+        self._div_days = np.zeros(0, dtype=np.int32)
+        self._div_amounts = np.zeros(0, dtype=np.float32)
+        if os.path.exists(self.path):
+            self.load()
+
+    @property
+    def days(self):
+        return self._days[:self.n_days]
+
+    @property
+    def closes(self):
+        return self._closes[:, :self.n_days]
+
+    @property
+    def dates(self):
+        return self.days.astype('datetime64[D]')
+
+    @property
+    def nbytes(self):
+        return (self._days.nbytes + self._closes.nbytes + self._div_rows.nbytes
+                + self._div_days.nbytes + self._div_amounts.nbytes)
+
+    def load(self):
+        with np.load(self.path, allow_pickle=False) as stored:
+            self.codes = [to_exchange_code(code) for code in stored['codes'].tolist()]
+            self._days = stored['days'].astype(np.int32)
+            self._closes = np.ascontiguousarray(stored['closes'], dtype=np.float32)
+            self._div_rows = stored['div_rows'].astype(np.int32)
+            self._div_days = stored['div_days'].astype(np.int32)
+            self._div_amounts = stored['div_amounts'].astype(np.float32)
+        self._rows = {code: row for row, code in enumerate(self.codes)}
+        self.n_days = len(self._days)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.splitext(os.path.basename(self.path))[0] + '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix='.tmp.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(
+                    f,
+                    codes=np.array(self.codes, dtype=str),
+                    days=self.days,
+                    closes=self.closes,
+                    div_rows=self._div_rows,
+                    div_days=self._div_days,
+                    div_amounts=self._div_amounts,
+                )
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _row(self, code):
+        code = to_exchange_code(code)
+        if code not in self._rows:
+            self._rows[code] = len(self.codes)
+            self.codes.append(code)
+            new_row = np.full((1, self._closes.shape[1]), np.nan, dtype=np.float32)
+            self._closes = np.vstack([self._closes, new_row])
+        return self._rows[code]
+
+    def _ensure_days(self, new_days):
+        # 新交易日多半接在最後，容量不足時多保留約一個月的交易日就地附加；若夾在既有日期中間才重排整個矩陣
+        missing = np.setdiff1d(new_days, self.days)
+        if len(missing) == 0:
+            return
+        if self.n_days == 0 or missing[0] > self.days[-1]:
+            needed = self.n_days + len(missing)
+            if needed > self._closes.shape[1]:
+                capacity = needed + GROWTH_DAYS
+                closes = np.full((self._closes.shape[0], capacity), np.nan, dtype=np.float32)
+                closes[:, :self.n_days] = self.closes
+                days = np.zeros(capacity, dtype=np.int32)
+                days[:self.n_days] = self.days
+                self._closes, self._days = closes, days
+            self._days[self.n_days:needed] = missing
+            self.n_days = needed
+        else:
+            all_days = np.union1d(self.days, missing).astype(np.int32)
+            closes = np.full((self._closes.shape[0], len(all_days)), np.nan, dtype=np.float32)
+            closes[:, np.searchsorted(all_days, self.days)] = self.closes
+            self._closes, self._days, self.n_days = closes, all_days, len(all_days)
+
+    def append(self, code, dates, closes, dividends=None):
+        # dates/closes/dividends 為同長度序列；dividends 為當日每單位配息（無配息為 0）
+        days = _to_days(dates)
+        closes = np.asarray(closes, dtype=np.float32)
+        row = self._row(code)
+        self._ensure_days(np.unique(days))
+        self._closes[row, np.searchsorted(self.days, days)] = closes
+        if dividends is not None:
+            dividends = np.asarray(dividends, dtype=np.float32)
+            paid = dividends > 0
+            # 同一ETF同一天的配息以新資料為準
+            keep = ~((self._div_rows == row) & np.isin(self._div_days, days[paid]))
+            self._div_rows = np.concatenate([self._div_rows[keep], np.full(paid.sum(), row, dtype=np.int32)])
+            self._div_days = np.concatenate([self._div_days[keep], days[paid]])
+            self._div_amounts = np.concatenate([self._div_amounts[keep], dividends[paid]])
+
+    def last_date(self, code):
+        row = self._rows.get(to_exchange_code(code))
+        if row is None:
+            return None
+        filled = np.flatnonzero(~np.isnan(self.closes[row]))
+        if len(filled) == 0:
+            return None
+        return pd.Timestamp(self.dates[filled[-1]])
+
+    def matrices(self, codes=None):
+        # 回傳 (代號, 日期, 向前補值後的收盤價矩陣, 同形狀的配息矩陣)，僅含有資料的代號；代號沿用呼叫端傳入的寫法
+        if codes is None:
+            codes = list(self.codes)
+        codes = [code for code in codes if to_exchange_code(code) in self._rows]
+        rows = np.array([self._rows[to_exchange_code(code)] for code in codes], dtype=int)
+        closes = forward_fill(self.closes[rows]) if len(rows) else np.zeros((0, self.n_days), dtype=np.float32)
+        dividends = np.zeros_like(closes)
+        if len(rows) and len(self._div_rows):
+            row_map = np.full(len(self.codes), -1)
+            row_map[rows] = np.arange(len(rows))
+            target = row_map[self._div_rows]
+            selected = target >= 0
+            columns = np.minimum(np.searchsorted(self.days, self._div_days[selected]), self.n_days - 1)
+            np.add.at(dividends, (target[selected], columns), self._div_amounts[selected])
+        return codes, self.dates, closes, dividends
+
+#########################################
+# 向量化分析：所有函式皆以 (ETF數, 交易日數) 矩陣為單位一次計算
+#########################################
+def forward_fill(closes):
+    valid = ~np.isnan(closes)
+    index = np.where(valid, np.arange(closes.shape[1]), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    return closes[np.arange(closes.shape[0])[:, None], index]
+
+def total_return_index(closes, dividends):
+    # 含息報酬指數，首個有效價格為 1；上市前為 NaN
+    closes = closes.astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = (closes[:, 1:] + dividends[:, 1:]) / closes[:, :-1]
+    ratio = np.where(np.isnan(ratio), 1.0, ratio)
+    index = np.cumprod(np.hstack([np.ones((closes.shape[0], 1)), ratio]), axis=1)
+    return np.where(np.isnan(closes), np.nan, index)
+
+def rolling_yield(closes, dividends, window=TRADING_DAYS_PER_YEAR):
+    # 近 window 個交易日配息合計 / 當日收盤價 (%)
+    cumulative = np.cumsum(dividends, axis=1, dtype=np.float64)
+    trailing = cumulative.copy()
+    trailing[:, window:] -= cumulative[:, :-window]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return trailing / closes * 100
+
+def drawdown(index):
+    with np.errstate(invalid='ignore'):
+        return index / np.fmax.accumulate(index, axis=1) - 1
+
+def yield_on_cost(closes, dividends, dates, buy_date, window=TRADING_DAYS_PER_YEAR):
+    # 以買進日收盤價為成本，計算最近一年配息的成本殖利率 (%)
+    column = min(np.searchsorted(dates, np.datetime64(pd.Timestamp(buy_date).date())), len(dates) - 1)
+    trailing = dividends[:, -window:].sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return trailing / closes[:, column] * 100
+
+def performance_summary(store, codes=None, buy_date=None):
+    # 指定 buy_date 時另加成本殖利率欄位
+    codes, dates, closes, dividends = store.matrices(codes)
+    if not codes or len(dates) == 0:
+        columns = ['股票代號', '總報酬率(%)', '年化報酬率(%)', '近一年殖利率(%)', '最大回撤(%)']
+        return pd.DataFrame(columns=columns + (['成本殖利率(%)'] if buy_date is not None else []))
+    index = total_return_index(closes, dividends)
+    listed = np.argmax(~np.isnan(closes), axis=1)
+    years = (dates[-1] - dates[listed]).astype(int) / 365.25
+    total = index[:, -1] - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annualized = np.where(years > 0, (1 + total) ** (1 / years) - 1, np.nan)
+    summary = pd.DataFrame({
+        '股票代號': codes,
+        '總報酬率(%)': total * 100,
+        '年化報酬率(%)': annualized * 100,
+        '近一年殖利率(%)': rolling_yield(closes, dividends)[:, -1],
+        '最大回撤(%)': np.nanmin(drawdown(index), axis=1) * 100,
+    })
+    if buy_date is not None:
+        summary['成本殖利率(%)'] = yield_on_cost(closes, dividends, dates, buy_date)
+    return summary
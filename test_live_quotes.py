@@ -0,0 +1,169 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import live_quotes
+from live_quotes import HttpQuoteFetcher, LiveQuoteCache, YahooQuoteFetcher, make_stub_handler
+
+PRICES = {'0056.TW': 35.0, '00878.TW': 21.0, '00679B.TWO': 28.0}
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class RecordingFetcher:
+    def __init__(self, prices=PRICES, error=None, gate=None):
+        self.prices = prices
+        self.error = error
+        self.gate = gate
+        self.batches = []
+
+    def __call__(self, symbols):
+        self.batches.append(list(symbols))
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        return {symbol: self.prices[symbol] for symbol in symbols if symbol in self.prices}
+
+def make_cache(fetcher, **kwargs):
+    clock = FakeClock()
+    return LiveQuoteCache(fetcher=fetcher, clock=clock, **kwargs), clock
+
+def flush_refresh(cache):
+    cache._refresher.submit(lambda: None).result(5)
+
+def test_fresh_quotes_are_served_from_cache():
+    fetcher = RecordingFetcher()
+    cache, clock = make_cache(fetcher, ttl=60)
+    assert cache.get_prices(['00056', '00878']) == {'00056': 35.0, '00878': 21.0}
+    clock.now = 59
+    assert cache.get_prices(['00056', '00878']) == {'00056': 35.0, '00878': 21.0}
+    assert cache.stats['upstream_calls'] == 1
+
+def test_concurrent_misses_are_coalesced():
+    gate = threading.Event()
+    fetcher = RecordingFetcher(gate=gate)
+    cache, _ = make_cache(fetcher)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_prices(['00056', '00878'])))
+               for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert cache.stats['upstream_calls'] == 1
+    assert results == [{'00056': 35.0, '00878': 21.0}] * 20
+
+def test_symbols_are_batched():
+    prices = {f"{number:05d}.TW": 10.0 for number in range(700, 820)}
+    fetcher = RecordingFetcher(prices=prices)
+    cache, _ = make_cache(fetcher, max_batch=50)
+    result = cache.get_quotes(list(prices))
+    assert len(result) == 120
+    assert [len(batch) for batch in fetcher.batches] == [50, 50, 20]
+
+def test_stale_quotes_are_returned_and_refreshed_in_background():
+    fetcher = RecordingFetcher()
+    cache, clock = make_cache(fetcher, ttl=60, stale_ttl=300)
+    cache.get_prices(['00056'])
+    fetcher.prices = {'0056.TW': 36.0}
+    clock.now = 100
+    assert cache.get_prices(['00056']) == {'00056': 35.0}
+    flush_refresh(cache)
+    assert cache.stats['stale_hits'] == 1
+    assert cache.stats['upstream_calls'] == 2
+    assert cache.get_prices(['00056']) == {'00056': 36.0}
+    assert cache.stats['upstream_calls'] == 2
+
+def test_stale_symbols_join_a_synchronous_batch():
+    fetcher = RecordingFetcher()
+    cache, clock = make_cache(fetcher, ttl=60)
+    cache.get_prices(['00056'])
+    clock.now = 100
+    cache.get_prices(['00056', '00878'])
+    flush_refresh(cache)
+    assert cache.stats['upstream_calls'] == 2
+    assert fetcher.batches[-1] == ['00878.TW', '00878.TWO', '0056.TW']
+
+def test_missing_symbols_are_negatively_cached():
+    fetcher = RecordingFetcher()
+    cache, clock = make_cache(fetcher, ttl=60)
+    for second in range(0, 60, 10):
+        clock.now = second
+        assert cache.get_prices(['00676R']) == {}
+    assert cache.stats['upstream_calls'] == 1
+    clock.now = 60
+    cache.get_prices(['00676R'])
+    assert cache.stats['upstream_calls'] == 2
+
+def test_errors_back_off_exponentially():
+    fetcher = RecordingFetcher(error=ConnectionError("down"))
+    cache, clock = make_cache(fetcher, ttl=60, max_backoff=900)
+    for second in range(0, 300, 10):
+        clock.now = second
+        assert cache.get_prices(['00056']) == {}
+    # 失敗後分別於 60、180 秒重試，下一次要到 420 秒
+    assert cache.stats['upstream_calls'] == 3
+    assert cache.stats['errors'] == 3
+
+def test_last_good_price_is_served_during_backoff():
+    fetcher = RecordingFetcher()
+    cache, clock = make_cache(fetcher, ttl=60, stale_ttl=300)
+    cache.get_prices(['00056'])
+    fetcher.error = ConnectionError("down")
+    clock.now = 61
+    assert cache.get_prices(['00056']) == {'00056': 35.0}
+    flush_refresh(cache)
+    clock.now = 62
+    assert cache.get_prices(['00056']) == {'00056': 35.0}
+    assert cache.stats['negative_hits'] == 1
+    assert cache.stats['upstream_calls'] == 2
+
+def test_unknown_market_is_resolved_once():
+    fetcher = RecordingFetcher()
+    cache, clock = make_cache(fetcher, ttl=60)
+    assert cache.get_prices(['00679B', '06201']) == {'00679B': 28.0}
+    assert fetcher.batches[0] == ['00679B.TW', '00679B.TWO', '006201.TWO']
+    clock.now = 1000
+    cache.get_prices(['00679B'])
+    assert fetcher.batches[-1] == ['00679B.TWO']
+
+def test_yahoo_fetcher_reads_latest_close(monkeypatch):
+    columns = pd.MultiIndex.from_product([['Close', 'Open'], ['0056.TW', '00878.TW']], names=['Price', 'Ticker'])
+    frame = pd.DataFrame([[35.0, 21.0, 34.0, 20.0], [35.5, np.nan, 35.0, 21.0]],
+                         index=pd.to_datetime(['2025-01-02', '2025-01-03']), columns=columns)
+    monkeypatch.setattr(live_quotes.yf, 'download', lambda *args, **kwargs: frame)
+    assert YahooQuoteFetcher()(['0056.TW', '00878.TW']) == {'0056.TW': 35.5, '00878.TW': 21.0}
+
+@pytest.fixture
+def stub_server():
+    counter = {'requests': 0, 'symbols': 0, 'lock': threading.Lock()}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_stub_handler(PRICES, 0.2, counter))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/quote", counter
+    server.shutdown()
+    server.server_close()
+
+def test_stub_server_sees_one_request_for_concurrent_sessions(stub_server):
+    url, counter = stub_server
+    cache = LiveQuoteCache(fetcher=HttpQuoteFetcher(url))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_prices(['00056', '00878', '00679B'])))
+               for _ in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert counter['requests'] == 1
+    assert cache.stats['upstream_calls'] == 1
+    assert len(results) == 50
+    assert all(set(result) == {'00056', '00878', '00679B'} for result in results)